@@ -3,14 +3,17 @@
 # visit http://127.0.0.1:8050/ in your web browser.
 
 # imports
+import json
+import os
+import time
 from datetime import timedelta
+from functools import wraps
 
 import numpy as np
 import plotly.graph_objects as go
-from dash import Dash, Input, Output, ctx, dcc, html, no_update
-from epispot import comps, models, pre
-from epispot.analysis import normalize
-from epispot.estimates.getters import query
+from dash import (ClientsideFunction, Dash, Input, Output, Patch, State, ctx,
+                  dcc, html, no_update)
+from flask import Response, abort, g, has_request_context, request
 from pandas import DataFrame, to_datetime
 
 import core
@@ -20,148 +23,71 @@ app = Dash(__name__)
 app.title = 'COVID-19 Notebook'
 server = app.server
 
+# switch map views and metrics in the browser, with NOTEBOOK_CLIENTSIDE=1
+clientside = os.environ.get('NOTEBOOK_CLIENTSIDE', '') not in ['', '0']
 
-# get data
-source = 'cumulative'
-df = core.find.data(source=source)
-counties = core.get.counties()
 
+# refreshes' process pools re-import this script as __mp_main__ when it is
+# run directly; only the server itself loads data at startup
+serving = __name__ != '__mp_main__'
 
-# globals
-index = 0
-data = [df.p_cases, df.p_deaths, df.death_rate]
-labels = ['p_cases', 'p_deaths', 'death_rate']
-zmax = [0.5, 0.01, 0.035]
-center = {'lat': 37.0902, 'lon': -95.7129}
-zoom = 3
+# get data, starting background refreshes
+if serving:
+    core.find.data(source='cumulative')
 
 
-# forecasting options
-forecast = {
-    'extent': 'None',
+# globals
+sources = ['Cumulative', 'Current']
+views = [
+    'Contiguous U.S.', 'Alaska', 'Hawaii',
+    'Puerto Rico & the U.S. Virgin Islands',
+    'Northern Mariana Islands'
+]
+metrics = ['Cases', 'Fatalities', 'Fatality Rate', 'Projected Cases']
+
+
+# forecasting parameters
+params = core.forecast.params
+projection = {  # forecast shown on the map for every county
     'model': 'SIR',
     'behavior': 'Average',
 }
-params = {
-    'gamma_inf': query(
-        ('SARS-CoV-2', 'Mehra et al. 2020', 'gamma')
-    )(0),
-    'delay': 7,
-    'undercount': 0.2,
-    'low': {
-        'R_0': 1.5,
-        'delta': 0.1,
-        'alpha': 0.0075,
-        'rho': 0.07,
-    },
-    'average': {
-        'R_0': 2.25,
-        'delta': 0.2,
-        'alpha': 0.01,
-        'rho': 0.1,
-    },
-    'high': {
-        'R_0': 3,
-        'delta': 0.3,
-        'alpha': 0.015,
-        'rho': 0.14,
-    }
-}
-
-
-# create main figure
-fig = go.Figure(go.Choroplethmapbox(
-    geojson=counties,
-    locations=df.fips,
-    z=df.p_cases,
-    zmin=0, zmax=0.5,
-    colorscale=[
-        [0, '#adffc2'],
-        [0.5, '#ff9382'],
-        [1, '#c90061']
-    ],
-    marker_line_width=0,
-    marker_opacity=0.75,
-    text=df.county + ', ' + df.state
-    + '<br>cases: '
-    + np.round(100 * df.p_cases, 1).astype(str) + '%'
-    + '<br>deaths: '
-    + np.round(100 * df.p_deaths, 1).astype(str) + '%'
-    + '<br>fatality rate: '
-    + np.round(100 * df.death_rate, 1).astype(str) + '%',
-    hoverinfo='text',
-))
-fig.update_layout(
-    mapbox_style='open-street-map',
-    mapbox_zoom=3,
-    mapbox_center={'lat': 37.0902, 'lon': -95.7129},
-)
-fig.update_layout(
-    margin={ 'r': 0, 't': 0, 'l': 0, 'b': 0 }
-)
 
 
 # helper funcs
-def update_source(value):
-    """Change data sources to fit selection"""
-    global df, source, index, data, labels, zmax
+def select_source(value):
+    """Look up the source, dataset, and metric columns for a selection"""
 
     # match selection
     match value:
         case 'Cumulative': source = 'cumulative'
         case 'Current': source = 'rolling'
 
-    # update source
+    # shared, cached dataset; never modified by callbacks
     df = core.find.data(source=source)
 
     # configure parameters
-    data = [df.p_cases, df.p_deaths, df.death_rate]
-    labels = ['p_cases', 'p_deaths', 'death_rate']
+    labels = ['p_cases', 'p_deaths', 'death_rate', 'p_projected']
+    zmax = [0.5, 0.01, 0.035, 0.5]
 
     if source == 'rolling':
-
-        data = [
-            df['cases_avg_per_100k'],
-            df['deaths_avg_per_100k'],
-            df['death_rate']
-        ]
         labels = [
             'cases_avg_per_100k',
             'deaths_avg_per_100k',
-            'death_rate'
+            'death_rate',
+            'p_projected'
         ]
+        zmax = [75, 1, 0.035, 0.5]
 
-    zmax = [0.5, 0.01, 0.035]
-    if source == 'rolling': zmax = [75, 1, 0.035]
+    return source, df, labels, zmax
 
-    # redraw figure
-    fig.update_traces(
-        locations=df.fips,
-        z=data[index],
-        zmax=zmax[index],
-        text=df.county + ', ' + df.state
-        + '<br>cases: '
-        + np.round(data[0], 1).astype(str) + '/100k'
-        + '<br>deaths: '
-        + np.round(data[1], 1).astype(str) + '/100k'
-        + '<br>fatality rate: '
-        + np.round(100 * data[2], 1).astype(str) + '%',
-    )
-    fig.update_layout(
-        mapbox_style='open-street-map',
-        mapbox_zoom=zoom,
-        mapbox_center=center,
-    )
+def select_view(value):
+    """Look up the map center, zoom, and region for a selection"""
 
-    return fig
-
-def change_map_view(value):
-    """Change map center and zoom depending on selection"""
-    global center, zoom
-
-    # default center, zoom
+    # default center, zoom, region: (west, south, east, north) boxes
     center = {'lat': 37.0902, 'lon': -95.7129}
     zoom = 3
+    region = [(-125, 24, -66, 50)]
 
     # match selection
     match value:
@@ -170,30 +96,24 @@ def change_map_view(value):
         case 'Alaska':
             center = {'lat': 63.3850, 'lon': -152.2683}
             zoom = 2
+            region = [(-180, 51, -129, 72), (172, 51, 180, 72)]
         case 'Hawaii':
             center = {'lat': 19.8983, 'lon': -155.5822}
             zoom = 5
+            region = [(-161, 18.5, -154, 22.5)]
         case 'Puerto Rico & the U.S. Virgin Islands':
             center = {'lat': 18.4389, 'lon': -66.0079}
             zoom = 6.5
+            region = [(-68, 17.5, -64.3, 18.8)]
         case 'Northern Mariana Islands':
             center = {'lat': 15.2, 'lon': 145.75}
             zoom = 7
+            region = [(144.8, 14, 146.2, 20.6)]
 
-    # update layout
-    fig.update_layout(
-        mapbox_style='open-street-map',
-        mapbox_zoom=zoom,
-        mapbox_center=center,
-    )
-
-    return fig
+    return center, zoom, region
 
-def change_choropleth(value):
-    """Change choropleth data to match selection"""
-    global index
-
-    # get appropriate data source
+def select_metric(value):
+    """Look up the metric index for a selection"""
     index = 0
 
     # match selection
@@ -201,20 +121,152 @@ def change_choropleth(value):
         case 'Cases': pass
         case 'Fatalities': index = 1
         case 'Fatality Rate': index = 2
+        case 'Projected Cases': index = 3
 
-    # change choropleth data
-    fig.update_traces(
-        z=data[index],
-        zmax=zmax[index],
+    return index
+
+def column(df, label):
+    """Look up a metric for each county, projecting cases if selected"""
+    if label != 'p_projected':
+        return df[label]
+
+    # forecast every county at once, from cumulative data
+    projected = core.forecast.project(
+        projection['model'], core.forecast.rates(projection['behavior']),
+        params['undercount'], params['delay']
     )
+    return df.fips.map(projected)
+
+def view_level(view):
+    """Look up the geometry detail level drawn in a view, by its index"""
+    return core.geometry.level(select_view(views[view])[1])
+
+def hover_template(label):
+    """Return the map hover template for a metric"""
+    if label == 'p_projected':  # the projection is only shown by color
+        return '%{text}<br>projected cases: %{z:.1%}<extra></extra>'
+    return '%{text}<extra></extra>'
+
+def geometry_payload(name, view=None):
+    """Return precompressed county GeoJSON for a level, clipped to a view"""
+    region = None if view is None else select_view(views[view])[2]
+    return core.geometry.encoded(name, region)
+
+def geometry_url(name, view=None):
+    """Return a URL for county geometry that changes with its content"""
+    path = f'/geometry/{name}.json'
+    if view is not None:
+        path = f'/geometry/{name}/{view}.json'
+    etag = geometry_payload(name, view)['etag']
+    return app.get_relative_path(f'{path}?v={etag}')
+
+def in_view(df, map_drop):
+    """Return a geometry URL and IDs of the counties to draw in a view"""
+    if clientside:  # views are switched in the browser, so send all
+        return geometry_url('medium'), set(df.fips)
+
+    view = views.index(map_drop)
+    name = view_level(view)
+    _, ids = core.geometry.clip(name, select_view(map_drop)[2])
+    return geometry_url(name, view), ids
+
+def clip(src_drop, map_drop, choro_drop):
+    """Select trace data for counties within the selected map region"""
+    _, df, labels, zmax = select_source(src_drop)
+    index = select_metric(choro_drop)
+
+    geojson, ids = in_view(df, map_drop)
+    visible = df.fips.isin(ids)
+    return {
+        'geojson': geojson,
+        'locations': df.fips[visible],
+        'z': column(df, labels[index])[visible],
+        'zmax': zmax[index],
+        'text': df.text[visible],  # precomputed hover text
+        'hovertemplate': hover_template(labels[index]),
+    }
+
+def create_figure(src_drop, map_drop, choro_drop):
+    """Build the main figure for a selection, with only the counties in view"""
+    trace = clip(src_drop, map_drop, choro_drop)
+    center, zoom, _ = select_view(map_drop)
+
+    fig = go.Figure(go.Choroplethmapbox(
+        **trace,
+        zmin=0,
+        colorscale=[
+            [0, '#adffc2'],
+            [0.5, '#ff9382'],
+            [1, '#c90061']
+        ],
+        marker_line_width=0,
+        marker_opacity=0.75,
+    ))
     fig.update_layout(
         mapbox_style='open-street-map',
         mapbox_zoom=zoom,
         mapbox_center=center,
     )
-
+    fig.update_layout(
+        margin={ 'r': 0, 't': 0, 'l': 0, 'b': 0 }
+    )
     return fig
 
+def default_figure():
+    """Return the figure that every new session starts with"""
+    return core.cache.fetch(
+        'layout', core.get.last_update(), None,
+        lambda: create_figure('Cumulative', 'Contiguous U.S.', 'Cases'),
+        kind='figure'
+    )
+
+def patch(trace=None, layout=None):
+    """Return only the changes to the main figure, as a partial update"""
+    trace, layout = trace or {}, layout or {}
+    out = Patch()
+
+    for key, value in trace.items():
+        out['data'][0][key] = value
+    for key, value in layout.items():  # e.g. mapbox_zoom => mapbox.zoom
+        parent, child = key.split('_')
+        out['layout'][parent][child] = value
+
+    return out
+
+def update_source(src_drop, map_drop, choro_drop):
+    """Change data sources to fit selection"""
+    trace = clip(src_drop, map_drop, choro_drop)
+
+    # redraw figure
+    return patch(trace={
+        key: trace[key] for key in ['locations', 'z', 'zmax', 'text']
+    })
+
+def change_map_view(src_drop, map_drop, choro_drop):
+    """Change map center and zoom depending on selection"""
+    trace = clip(src_drop, map_drop, choro_drop)
+    center, zoom, _ = select_view(map_drop)
+
+    # update layout, sending only counties in the region, at a level of
+    # detail that suits the zoom
+    return patch(trace={
+        key: trace[key] for key in ['geojson', 'locations', 'z', 'text']
+    }, layout={
+        'mapbox_zoom': zoom,
+        'mapbox_center': center,
+    })
+
+def change_choropleth(src_drop, map_drop, choro_drop):
+    """Change choropleth data to match selection"""
+    trace = clip(src_drop, map_drop, choro_drop)
+
+    # change choropleth data
+    return patch(trace={
+        'z': trace['z'],
+        'zmax': trace['zmax'],
+        'hovertemplate': trace['hovertemplate'],
+    })
+
 def generate_info(src, map, choro):
     """Generate info text based on selection"""
 
@@ -254,6 +306,10 @@ def generate_info(src, map, choro):
         case 'Fatality Rate':
             data = 'fatality rate'
             format = 'as percentage of total cases'
+        case 'Projected Cases':  # always forecast from cumulative data
+            data = f'cases projected {core.forecast.HORIZON} days from now ' \
+                + '(from cumulative totals)'
+            format = 'as percentage of total population'
 
     # generate info text
     text = [
@@ -263,46 +319,25 @@ def generate_info(src, map, choro):
 
     return text
 
-def format_data(col, index):
-    """Format data column for plotly display"""
-
-    label = labels[index]
-    match label:
-        case 'p_cases' | 'p_deaths' | 'death_rate':
-            return np.round(col * 100, 1).astype(str) + '%'
-        case 'cases_avg_per_100k' | 'deaths_avg_per_100k':
-            return np.round(col, 1).astype(str) + '/100k'
-
-def format_date(col):
-    """Format date column (as list of strings) for plotly display"""
-
-    # convert string of format '%Y-%m-%d' to date object
-    date = to_datetime(col)
-    return date.dt.strftime('%-m/%-d')
-
 def get_forecast_data(fips):
     """Get forecast data for a specific FIPS code"""
-    data = core.find.historical(fips, source='cumulative')
-    return data.drop(columns=['county', 'state', 'fips'])
+    return core.find.historical(
+        fips, source='cumulative',
+        columns=['cases', 'deaths', 'population']
+    )
 
-def to_series(predictions, dates, n, source):
+def to_series(predictions, dates, n, source, model):
     """Turn predictions into formatted series and rearrange"""
 
     def frame(cols, names, dates):
         """Put columns into data frames and format"""
         out = []
         for i, col in enumerate(cols):
-            # match scaling
-            if source == 'rolling' and index in [0, 1]:
-                out.append(DataFrame({
-                    'date': dates[:len(col)],
-                    names[i]: 100 * col / n
-                }))
-            else:
-                out.append(DataFrame({
-                    'date': dates[:len(col)],
-                    names[i]: col / n
-                }))
+            # scaling is matched to the data source in add_to_figure
+            out.append(DataFrame({
+                'date': dates[:len(col)],
+                names[i]: col / n
+            }))
 
         return out
 
@@ -314,7 +349,7 @@ def to_series(predictions, dates, n, source):
         )
         return active, recovered
 
-    last = to_datetime(dates.tail(1).values[0]) \
+    last = to_datetime(dates[-1]) \
         - timedelta(days=params['delay'])
     future = [
         last + timedelta(days=i + 1)
@@ -322,7 +357,7 @@ def to_series(predictions, dates, n, source):
     ]
     predictions = np.array(predictions)
 
-    match forecast['model']:
+    match model:
 
         case 'SIR':
             infected, removed = frame(
@@ -370,128 +405,21 @@ def to_series(predictions, dates, n, source):
             )
             return exposed, infected, recovered, dead
 
-def create_seird(r_0, gamma, n, alpha, rho, delta):
-    """Create and returned a pre-compiled SEIRD model"""
-
-    # compile compartments
-    susceptible = comps.Susceptible(r_0, gamma, n)
-    exposed = comps.Exposed()
-    infected = comps.Infected()
-    recovered = comps.Recovered()
-    dead = comps.Dead()
-
-    # compile parameters
-    matrix = np.empty((5, 5), dtype=tuple)
-    matrix.fill((1.0, 1.0))  # default probability and rate
-
-    matrix[1][2] = (1, delta)
-
-    recovery_rate = (gamma - alpha * rho) / (1 - alpha)
-    matrix[2][3] = (1 - alpha, recovery_rate)  # I => R
-    matrix[2][4] = (alpha, rho)  # I => D
-
-    # compile model
-    seird_model = models.Model(n)
-    seird_model.add(susceptible, [1], matrix[0])
-    seird_model.add(exposed, [2], matrix[1])
-    seird_model.add(infected, [3, 4], matrix[2])
-    seird_model.add(recovered, [], matrix[3])
-    seird_model.add(dead, [], matrix[4])
-    seird_model.compile()
-
-    return seird_model
-
 def forecast_historical(data):
     """Generate historical forecasts of other compartments"""
-
-    # process available data
-    total_infected = normalize.count(
-        data['cases'], params['undercount']
+    return core.forecast.historical(
+        data['cases'], data['deaths'],
+        params['undercount'], round(1 / params['gamma_inf']), params['delay']
     )
-    total_fatalities = normalize.count(
-        data['deaths'], params['undercount']
-    )
-    infected_deltas = normalize.deltas(total_infected)
-    fatalities_deltas = normalize.deltas(total_fatalities)
 
-    # normalize data
-    infected = normalize.active(
-        infected_deltas, round(1 / params['gamma_inf']), delay=params['delay']
-    )
-    infected_deltas = normalize.shift(
-        infected_deltas, params['delay']
-    )
-    fatalities_deltas = normalize.shift(
-        fatalities_deltas, params['delay']
-    )
-
-    # extract missing data
-    fatalities_deltas = normalize.bound(
-        infected, infected_deltas, fatalities_deltas
-    )
-    recovered_deltas = normalize.recovered(
-        infected, infected_deltas, fatalities_deltas
-    )
-
-    # get cumulative data
-    fatalities = normalize.cumulative(fatalities_deltas)
-    recovered = normalize.cumulative(recovered_deltas)
-
-    return infected, fatalities, recovered
-
-def forecast_all(historical, n):
+def forecast_all(historical, n, model, behavior, solver='epispot'):
     """Generate predictive forecasts for all compartments"""
-
-    # process available data
-    infected, fatalities, recovered = historical
-    infected = infected[-1]
-    fatalities = fatalities[-1]
-    recovered = recovered[-1]
-    remaining = n - (infected + fatalities + recovered)
-
-    # get parameter set
-    param_set = None
-    match forecast['behavior']:
-        case 'Low Transmission': param_set = params['low']
-        case 'Average': param_set = params['average']
-        case 'High Transmission': param_set = params['high']
-
-    # initialize model
-    model = None
-    state = None
-
-    match forecast['model']:
-        case 'SIR':
-            model = pre.sir(param_set['R_0'], params['gamma_inf'], n)
-            state = [remaining, infected, fatalities + recovered]
-        case 'SEIR':
-            model = pre.seir(
-                param_set['R_0'], params['gamma_inf'], n,
-                param_set['delta']
-            )
-            state = [remaining, 0, infected, fatalities + recovered]
-        case 'SIRD':
-            model = pre.sird(
-                param_set['R_0'], params['gamma_inf'], n,
-                param_set['alpha'], param_set['rho']
-            )
-            state = [remaining, infected, recovered, fatalities]
-        case 'SEIRD':
-            model = create_seird(
-                param_set['R_0'], params['gamma_inf'], n,
-                param_set['alpha'], param_set['rho'],
-                param_set['delta']
-            )
-            state = [remaining, 0, infected, recovered, fatalities]
-
-    # get predictions
-    predicted = model.integrate(
-        range(14 + params['delay']),
-        starting_state=np.array(state)
+    return core.forecast.solve(
+        model, core.forecast.start(model, historical, n), n,
+        core.forecast.rates(behavior), 14 + params['delay'], solver
     )
-    return predicted
 
-def add_to_figure(fig, series):
+def add_to_figure(fig, series, source, index, mode='lines+markers', **style):
     """Add one or more series to the figure"""
 
     def scale(k):
@@ -507,42 +435,143 @@ def add_to_figure(fig, series):
             x=col['date'],
             y=scale(col.iloc[:, 1]),
             name=col.columns[1],
-            mode='lines+markers',
-            text=format_date(col['date']) + ': '
+            mode=mode,
+            text=core.display.dates(col['date']) + ': '
             + format_scale(col.iloc[:, 1]),
             hoverinfo='text',
+            **style,
         ))
 
-def run_forecast(fig, fips):
-    """"Run a forecast and add its results to the county graph"""
-    data = get_forecast_data(fips)
-    population = data['population'].values[0]
+def add_bands(fig, bands, source, index):
+    """Add median forecasts with shaded percentile bands to the figure"""
+    lower, median, upper = bands
+
+    # fill from each upper edge down to its lower edge
+    for low, high in zip(lower, upper):
+        edge = {'mode': 'lines', 'line_width': 0, 'showlegend': False}
+        add_to_figure(fig, [high], source, index, **edge)
+        add_to_figure(fig, [low], source, index, fill='tonexty', **edge)
+
+    add_to_figure(fig, median, source, index)
+
+def forecast_series(fips, model, behavior, solver):
+    """Compute historical and predicted series for a county, with caching"""
+
+    def compute():
+        stored = core.scenarios.lookup(fips, model, behavior, solver)
+        if stored is not None:  # precomputed after the last refresh
+            dates = stored['dates']
+            population = stored['population']
+            historical = stored['historical']
+            predictions = stored['predicted']
+        else:
+            data = get_forecast_data(fips)
+            dates = data['date']
+            population = data['population'][0]
+            historical = forecast_historical(data)
+            predictions = forecast_all(
+                historical, population, model, behavior, solver
+            )
+
+        return (
+            to_series(historical, dates, population, 'historical', model),
+            to_series(predictions, dates, population, 'all', model),
+        )
+
+    # results are reused until the data or any forecasting parameter changes
+    settings = (model, behavior, solver, json.dumps(params, sort_keys=True))
+    return core.cache.fetch(
+        fips, core.get.last_update(), settings, compute, kind='forecast'
+    )
+
+def ensemble_series(fips, model, behavior):
+    """Compute percentile bands of sampled forecasts for a county
+
+    Ensembles are always integrated with RK4, in one batch; the solver
+    option is locked to it while they are shown.
+    """
+
+    def compute():
+        data = get_forecast_data(fips)
+        population = data['population'][0]
+        historical = forecast_historical(data)
+
+        # all sampled parameter sets are integrated in one batch
+        bands = core.forecast.ensemble(
+            model, historical, population,
+            core.forecast.sample(behavior), 14 + params['delay']
+        )
+        return [
+            to_series(band, data['date'], population, 'all', model)
+            for band in bands
+        ]
 
-    historical = forecast_historical(data)
-    series = to_series(historical, data['date'], population, 'historical')
-    add_to_figure(fig, series)
+    settings = (model, behavior, json.dumps(params, sort_keys=True))
+    return core.cache.fetch(
+        fips, core.get.last_update(), settings, compute, kind='ensemble'
+    )
 
-    if forecast['extent'] == 'Historical':
-        return fig
+def run_forecast(fig, fips, forecast, source, index):
+    """"Run a forecast and add its results to the county graph"""
+    historical, predicted = forecast_series(
+        fips, forecast['model'], forecast['behavior'], forecast['solver']
+    )
+    add_to_figure(fig, historical, source, index)
+
+    match forecast['extent']:
+        case 'Historical': pass
+        case 'Comprehensive': add_to_figure(fig, predicted, source, index)
+        case 'Ensemble':
+            bands = ensemble_series(
+                fips, forecast['model'], forecast['behavior']
+            )
+            add_bands(fig, bands, source, index)
 
-    predictions = forecast_all(historical, population)
-    series = to_series(predictions, data['date'], population, 'all')
-    add_to_figure(fig, series)
     return fig
 
+def map_data(src_drop):
+    """Collect everything the browser needs to switch views and metrics"""
+    _, df, labels, zmax = select_source(src_drop)
+    return {
+        'locations': df.fips,
+        'text': df.text,
+        'z': [column(df, label) for label in labels],
+        'zmax': zmax,
+        'hovertemplate': [hover_template(label) for label in labels],
+        'views': {
+            view: dict(zip(['center', 'zoom'], select_view(view)[:2]))
+            for view in views
+        },
+        'info': {  # lines of info text, skipping the line break
+            view: {
+                metric: generate_info(src_drop, view, metric)[::2]
+                for metric in metrics
+            }
+            for view in views
+        },
+    }
+
+
+# compress the county geometry served in this mode once, at startup
+if serving and clientside:
+    geometry_payload('medium')
+elif serving:
+    for view in range(len(views)):
+        geometry_payload(view_level(view), view)
+
 
 # callbacks
-@app.callback(
-    [
-        Output('graph', 'figure'),
-        Output('info', 'children'),
-    ],
-    [
-        Input('source-dropdown', 'value'),
-        Input('map-dropdown', 'value'),
-        Input('choropleth-dropdown', 'value')
-    ]
-)
+def timed(callback):
+    """Note when a callback returns, so that encoding can be timed apart"""
+    @wraps(callback)
+    def wrapper(*args, **kwargs):
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            if has_request_context():
+                g.computed = time.perf_counter()
+    return wrapper
+
 def update_figure(src_drop, map_drop, choro_drop):
     """Responsible for all updates to the main figure"""
 
@@ -554,43 +583,106 @@ def update_figure(src_drop, map_drop, choro_drop):
 
     match id:
         case 'source-dropdown':
-            out = update_source(src_drop)
+            out = update_source(src_drop, map_drop, choro_drop)
         case 'map-dropdown':
-            out = change_map_view(map_drop)
+            out = change_map_view(src_drop, map_drop, choro_drop)
         case 'choropleth-dropdown':
-            out = change_choropleth(choro_drop)
+            out = change_choropleth(src_drop, map_drop, choro_drop)
 
     info_out = generate_info(src_drop, map_drop, choro_drop)
     return out, info_out
 
+def update_map_data(src_drop):
+    """Send the browser the data for a newly selected source"""
+    return map_data(src_drop)
+
+
+if clientside:
+    app.clientside_callback(
+        ClientsideFunction(namespace='notebook', function_name='updateMap'),
+        [
+            Output('graph', 'figure'),
+            Output('info', 'children'),
+        ],
+        [
+            Input('map-data', 'data'),
+            Input('map-dropdown', 'value'),
+            Input('choropleth-dropdown', 'value')
+        ],
+        State('graph', 'figure'),
+    )
+    app.callback(
+        Output('map-data', 'data'),
+        Input('source-dropdown', 'value'),
+        prevent_initial_call=True
+    )(timed(update_map_data))
+else:
+    app.callback(
+        [
+            Output('graph', 'figure'),
+            Output('info', 'children'),
+        ],
+        [
+            Input('source-dropdown', 'value'),
+            Input('map-dropdown', 'value'),
+            Input('choropleth-dropdown', 'value')
+        ]
+    )(timed(update_figure))
+
+
 @app.callback(
     [
         Output('county-info-name', 'children'),
         Output('county-graph-container', 'children')
     ],
-    Input('graph', 'clickData')
+    Input('graph', 'clickData'),
+    [
+        State('source-dropdown', 'value'),
+        State('choropleth-dropdown', 'value'),
+        State('forecast-extent', 'value'),
+        State('forecast-model', 'value'),
+        State('forecast-behavior', 'value'),
+        State('forecast-solver', 'value')
+    ]
 )
-def update_county(click_data):
+@timed
+def update_county(
+    click_data, src_drop, choro_drop, extent, model, behavior, solver
+):
     """Responsible for updating the county popup"""
 
     # get info
     if click_data is None:
         return no_update
 
+    source, _, labels, _ = select_source(src_drop)
+    index = select_metric(choro_drop)
+    if labels[index] == 'p_projected':  # no history; show the cases instead
+        index = 0
+    forecast = {
+        'extent': extent,
+        'model': model,
+        'behavior': behavior,
+        'solver': solver,
+    }
+
     fips = click_data['points'][0]['location']
 
     # process county data
-    data = core.find.historical(fips, source=source)
-    name = data['county'].values[0] + ', ' + data['state'].values[0]
+    label = labels[index]
+    data = core.find.historical(
+        fips, source=source,
+        columns=['county', 'state', label, f'{label}_text']
+    )
+    name = data['county'][0] + ', ' + data['state'][0]
 
-    # generate figure
+    # generate figure, with precomputed hover text
     fig = go.Figure(go.Scatter(
         x=data['date'],
-        y=data[labels[index]],
+        y=data[label],
         name='data',
         mode='lines+markers',
-        text=format_date(data['date']) + ': '
-        + format_data(data[labels[index]], index),
+        text=data[f'{label}_text'],
         hoverinfo='text',
     ))
     fig.update_layout(
@@ -599,95 +691,165 @@ def update_county(click_data):
 
     # add forecasts
     if forecast['extent'] != 'None':
-        run_forecast(fig, fips)
+        run_forecast(fig, fips, forecast, source, index)
 
     return name, dcc.Graph(figure=fig, id='county-graph')
 
+
 @app.callback(
-    Output('void-forecast', 'children'),
     [
-        Input('forecast-extent', 'value'),
-        Input('forecast-model', 'value'),
-        Input('forecast-behavior', 'value')
-    ]
+        Output('forecast-solver', 'options'),
+        Output('forecast-solver', 'value'),
+    ],
+    Input('forecast-extent', 'value'),
+    prevent_initial_call=True
 )
-def update_forecast(extent, model, behavior):
-    """Modify forecasting parameters"""
-    global forecast
-    forecast = {
-        'extent': extent,
-        'model': model,
-        'behavior': behavior,
-    }
-    return no_update
-
-
-# create app layout
-app.layout = html.Div(children=[
-    html.H1(children='COVID-19 Notebook'),
-    html.Div(children='''
-        An interactive notebook for examining trends in COVID-19 cases
-    ''', id='subtitle'),
-    dcc.Dropdown(
-        ['Cumulative', 'Current'], 'Cumulative',
-        id='source-dropdown'
-    ),
-    dcc.Dropdown([
-        'Contiguous U.S.', 'Alaska', 'Hawaii',
-        'Puerto Rico & the U.S. Virgin Islands',
-        'Northern Mariana Islands'
-    ], 'Contiguous U.S.', id='map-dropdown'),
-    dcc.Dropdown(
-        ['Cases', 'Fatalities', 'Fatality Rate'], 'Cases',
-        id='choropleth-dropdown'
-    ),
-    html.Div(children=[
-        dcc.Graph(figure=fig, id='graph'),
-        html.Div(children=[
-            html.H2(children='No county selected.', id='county-info-name'),
-            html.Div(children=[], id='county-graph-container'),
-        ], id='county-info'),
-    ], id='graph-container'),
-    html.H2(children='Forecasting Options'),
-    html.Div(children=[
+@timed
+def update_solver(extent):
+    """Lock the solver to RK4 for ensembles, which are only solved by it"""
+    if extent != 'Ensemble':
+        return core.forecast.SOLVERS, no_update
+
+    return [
+        {'label': solver, 'value': solver, 'disabled': True}
+        for solver in core.forecast.SOLVERS
+    ], 'RK4'
+
+
+# server routes
+def serve(payload):
+    """Respond with a precompressed payload and HTTP caching headers"""
+    encoding = 'identity'
+    for option in ['br', 'gzip']:
+        if option in payload and request.accept_encodings[option]:
+            encoding = option
+            break
+
+    response = Response(payload[encoding], mimetype='application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+
+    # content-hashed URLs never change; anything else is revalidated
+    cache_control = 'public, no-cache'
+    if request.args.get('v') == payload['etag']:
+        cache_control = 'public, max-age=31536000, immutable'
+    response.headers['Cache-Control'] = cache_control
+    response.set_etag(payload['etag'], weak=True)
+    return response.make_conditional(request)
+
+@server.route('/geometry/<name>.json')
+@server.route('/geometry/<name>/<int:view>.json')
+def geometry(name, view=None):
+    """Serve pre-encoded county GeoJSON for a level, clipped to a view"""
+    if name not in core.geometry.LEVELS:
+        abort(404)
+    if view is not None and not (
+        0 <= view < len(views) and name == view_level(view)
+    ):
+        abort(404)
+    return serve(geometry_payload(name, view))
+
+@server.route('/metrics/callbacks')
+def callback_metrics():
+    """Report average response sizes and timings of each callback"""
+    return Response(
+        core.encode.dumps(core.encode.metrics()), mimetype='application/json'
+    )
+
+@server.before_request
+def start_timer():
+    """Time every request, for callback metrics"""
+    g.started = time.perf_counter()
+
+@server.after_request
+def record_metrics(response):
+    """Record the size, compute time, and encode time of callbacks"""
+    if 'computed' in g:
+        core.encode.record(
+            request.get_json()['output'], len(response.get_data()),
+            g.computed - g.started, time.perf_counter() - g.computed
+        )
+    return response
+
+
+# create app layout, with a new figure for each page load
+def layout():
+    """Build the page for a new session from the latest data"""
+    return html.Div(children=[
+        html.H1(children='COVID-19 Notebook'),
+        html.Div(children='''
+            An interactive notebook for examining trends in COVID-19 cases
+        ''', id='subtitle'),
+        dcc.Dropdown(sources, 'Cumulative', id='source-dropdown'),
+        dcc.Dropdown(views, 'Contiguous U.S.', id='map-dropdown'),
+        dcc.Dropdown(metrics, 'Cases', id='choropleth-dropdown'),
+        dcc.Store(
+            data=map_data('Cumulative') if clientside else None,
+            id='map-data'
+        ),
         html.Div(children=[
-            html.H3(children='Extent'),
-            dcc.RadioItems(
-                ['None', 'Historical', 'Comprehensive'],
-                'None', id='forecast-extent'
+            dcc.Graph(
+                figure=default_figure(),
+                id='graph'
             ),
-        ], className='forecasting-option'),
+            html.Div(children=[
+                html.H2(
+                    children='No county selected.', id='county-info-name'
+                ),
+                html.Div(children=[], id='county-graph-container'),
+            ], id='county-info'),
+        ], id='graph-container'),
+        html.H2(children='Forecasting Options'),
         html.Div(children=[
-            html.H3(children='Model'),
-            dcc.RadioItems(
-                ['SIR', 'SIRD', 'SEIR', 'SEIRD'],
-                'SIR', id='forecast-model'
-            ),
-        ], className='forecasting-option'),
+            html.Div(children=[
+                html.H3(children='Extent'),
+                dcc.RadioItems(
+                    ['None', 'Historical', 'Comprehensive', 'Ensemble'],
+                    'None', id='forecast-extent'
+                ),
+            ], className='forecasting-option'),
+            html.Div(children=[
+                html.H3(children='Model'),
+                dcc.RadioItems(
+                    ['SIR', 'SIRD', 'SEIR', 'SEIRD'],
+                    'SIR', id='forecast-model'
+                ),
+            ], className='forecasting-option'),
+            html.Div(children=[
+                html.H3(children='Behavior'),
+                dcc.RadioItems(
+                    ['Low Transmission', 'Average', 'High Transmission'],
+                    'Average', id='forecast-behavior'
+                ),
+            ], className='forecasting-option'),
+            html.Div(children=[
+                html.H3(children='Solver'),
+                dcc.RadioItems(
+                    core.forecast.SOLVERS,
+                    'epispot', id='forecast-solver'
+                ),
+            ], className='forecasting-option'),
+        ], id='forecasting-options'),
         html.Div(children=[
-            html.H3(children='Behavior'),
-            dcc.RadioItems(
-                ['Low Transmission', 'Average', 'High Transmission'],
-                'Average', id='forecast-behavior'
-            ),
-        ], className='forecasting-option'),
-    ], id='forecasting-options'),
-    html.Div(children=[
-        'Viewing cumulative totals for all counties in the contiguous U.S.',
-        html.Br(), 'Showing cases as percentage of total population.'
-    ], id='info'),
-    dcc.Markdown(
-        children='Data from *The New York Times*, based on reports from state '
-        + 'and local health agencies.  \n'
-        + 'See also: '
-        + '<https://www.nytimes.com/interactive/2020/us/coronavirus-us-cases'
-        + '.html>.  \n'
-        + f'Last updated {core.get.last_update()}, at midnight UTC.',
-        id='footer'
-    ),
-    # for callbacks w/ no output
-    html.Div(id='void-forecast', style={ 'display': 'none' })
-])
+            'Viewing cumulative totals for all counties in the '
+            + 'contiguous U.S.',
+            html.Br(), 'Showing cases as percentage of total population.'
+        ], id='info'),
+        dcc.Markdown(
+            children='Data from *The New York Times*, based on reports from '
+            + 'state and local health agencies.  \n'
+            + 'See also: '
+            + '<https://www.nytimes.com/interactive/2020/us/coronavirus-us-'
+            + 'cases.html>.  \n'
+            + f'Last updated {core.get.last_update()}, at midnight UTC.',
+            id='footer'
+        ),
+    ])
+
+
+if serving:  # Dash builds a function layout once to validate it
+    app.layout = layout
 
 
 # run app
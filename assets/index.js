@@ -1 +1,42 @@
 // Frontend logic for the application
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    notebook: {
+        // switch map views and metrics without a round trip to the server
+        updateMap: function(mapData, view, metric, figure) {
+            const index = ['Cases', 'Fatalities', 'Fatality Rate', 'Projected Cases']
+                .indexOf(metric);
+            const triggered = dash_clientside.callback_context.triggered
+                .map((t) => t.prop_id);
+
+            // swap in the selected metric
+            const trace = Object.assign({}, figure.data[0], {
+                locations: mapData.locations,
+                text: mapData.text,
+                z: mapData.z[index],
+                zmax: mapData.zmax[index],
+                hovertemplate: mapData.hovertemplate[index],
+            });
+
+            // only recenter when the view itself changes
+            const mapbox = Object.assign({}, figure.layout.mapbox);
+            if (triggered.includes('map-dropdown.value')) {
+                mapbox.center = mapData.views[view].center;
+                mapbox.zoom = mapData.views[view].zoom;
+            }
+
+            const info = mapData.info[view][metric];
+            return [
+                Object.assign({}, figure, {
+                    data: [trace],
+                    layout: Object.assign({}, figure.layout, { mapbox: mapbox }),
+                }),
+                [
+                    info[0],
+                    { namespace: 'dash_html_components', type: 'Br', props: {} },
+                    info[1],
+                ],
+            ];
+        },
+    },
+});
@@ -0,0 +1,33 @@
+"""Shared setup and timing for the benchmarks
+
+Importing this module moves to the repository root and makes `core`
+importable, so benchmarks can be started from any directory.
+"""
+
+# imports
+import os
+import sys
+import time
+
+# constants
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run from the repository root, where `core` and `data/` are
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+
+# functions
+def measure(step, repeat, prepare=tuple):
+    """Return the best time, in seconds, of `repeat` runs of a step
+
+    `prepare` returns the step's arguments without being timed, e.g. fresh
+    copies of inputs that the step modifies.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        args = prepare()
+        start = time.perf_counter()
+        step(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
@@ -0,0 +1,97 @@
+"""Check and benchmark the array forecast solvers against epispot's models
+
+Run with `python benchmarks/integrate.py`.
+
+epispot forecasts are made exactly as the app makes them, with
+`forecast.simulate`, so the check runs against whichever epispot the app
+uses. The 'euler' method takes the same daily forward Euler steps as
+epispot, so it must match epispot exactly. RK4 does not: epispot's daily
+steps are far from converged, so the two differ by up to several percent
+of population (about 7% for SIR under high transmission). That whole
+difference must be epispot's step size, so Euler with many small steps
+must converge to RK4.
+"""
+
+# imports
+import numpy as np
+
+from common import measure
+from core import forecast
+
+# constants
+POPULATION = 100_000
+HISTORICAL = ([2_000], [100], [5_000])  # infected, fatalities, recovered
+SCENARIOS = [1, 100, 1_000]
+TOLERANCE = 1e-9  # largest Euler difference, as a share of population
+CONVERGED = 1e-3  # largest fine Euler vs. RK4 difference, likewise
+FINE = 1_024  # Euler steps per day when checking convergence
+REPEAT = 5
+
+
+# functions
+def sweep(size):
+    """Draw `size` parameter sets around the average behavior"""
+    rng = np.random.default_rng(0)
+    average = forecast.rates('Average')
+    return [
+        {
+            key: value * rng.uniform(0.5, 1.5) if key != 'gamma' else value
+            for key, value in average.items()
+        }
+        for _ in range(size)
+    ]
+
+def check(model, state, rates, days):
+    """Assert parity with epispot, returning the RK4 difference from it"""
+    solve = lambda **kwargs: forecast.integrate(
+        model, state, POPULATION, rates, days, **kwargs
+    )[:, 0]
+    share = lambda a, b: np.max(np.abs(a - b)) / POPULATION
+
+    old = forecast.simulate(model, state, POPULATION, rates, days)
+    euler = share(solve(steps=1, method='euler'), old)
+    assert euler < TOLERANCE, f'{model}: Euler differs from epispot by {euler}'
+
+    rk4 = solve()
+    converged = share(solve(steps=FINE, method='euler'), rk4)
+    assert converged < CONVERGED, f'{model}: RK4 differs by {converged}'
+    return share(rk4, old)
+
+def main():
+    """Print parity with epispot and single vs. batched timings"""
+    days = forecast.HORIZON + forecast.params['delay']
+    print(f'{"model":<7}{"RK4 diff":>10}', end='')
+    print(''.join(f'{f"{size} runs":>24}' for size in SCENARIOS))
+
+    for model in forecast.MODELS:
+        state = forecast.start(model, HISTORICAL, POPULATION)
+
+        # parity for every behavior; the largest RK4 difference is shown
+        difference = max(
+            check(model, state, forecast.rates(behavior), days)
+            for behavior in forecast.BEHAVIORS
+        )
+        print(f'{model:<7}{difference:>10.1e}', end='')
+
+        # one epispot model per scenario vs. one batched integration
+        rates = forecast.rates('Average')
+        for size in SCENARIOS:
+            sets = sweep(size)
+            batched = {key: np.array([s[key] for s in sets]) for key in rates}
+            states = np.repeat(state[np.newaxis], size, axis=0)
+            before = measure(lambda: [
+                forecast.simulate(model, state, POPULATION, s, days)
+                for s in sets
+            ], REPEAT)
+            after = measure(lambda: forecast.integrate(
+                model, states, POPULATION, batched, days
+            ), REPEAT)
+            print(
+                f'{before * 1e3:>9.2f}ms{after * 1e3:>8.2f}ms'
+                f'{before / after:>5.0f}x', end=''
+            )
+        print()
+
+
+if __name__ == '__main__':
+    main()
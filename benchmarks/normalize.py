@@ -0,0 +1,89 @@
+"""Benchmark array normalization against epispot's per-county pipeline
+
+Run with `python benchmarks/normalize.py`.
+"""
+
+# imports
+import numpy as np
+from epispot.analysis import normalize
+
+from common import measure
+from core import forecast
+
+# constants
+COUNTIES = [1, 10, 100]
+DAYS = 1_100  # about the length of the NYTimes series
+REPEAT = 3
+
+
+# original implementation
+def historical(cases, deaths, undercount, period, delay):
+    total_infected = normalize.count(cases, undercount)
+    total_fatalities = normalize.count(deaths, undercount)
+    infected_deltas = normalize.deltas(total_infected)
+    fatalities_deltas = normalize.deltas(total_fatalities)
+
+    infected = normalize.active(infected_deltas, period, delay=delay)
+    infected_deltas = normalize.shift(infected_deltas, delay)
+    fatalities_deltas = normalize.shift(fatalities_deltas, delay)
+
+    fatalities_deltas = normalize.bound(
+        infected, infected_deltas, fatalities_deltas
+    )
+    recovered_deltas = normalize.recovered(
+        infected, infected_deltas, fatalities_deltas
+    )
+
+    fatalities = normalize.cumulative(fatalities_deltas)
+    recovered = normalize.cumulative(recovered_deltas)
+    return infected, fatalities, recovered
+
+
+# functions
+def synthetic(counties):
+    """Create cumulative cases and deaths for `counties` counties"""
+    rng = np.random.default_rng(0)
+    cases = np.cumsum(rng.poisson(20, (counties, DAYS)), axis=1)
+    deaths = np.cumsum(rng.binomial(cases // 100 + 1, 0.01), axis=1)
+    return cases.astype(np.float64), deaths.astype(np.float64)
+
+def check(cases, deaths, args):
+    """Assert that both implementations agree for every county"""
+    batch = forecast.historical(cases, deaths, *args)
+    for i in range(len(cases)):
+        original = historical(list(cases[i]), list(deaths[i]), *args)
+        for old, new in zip(original, batch):
+            np.testing.assert_allclose(new[i], old, rtol=1e-9, atol=1e-6)
+
+def main():
+    """Print a table of per-county epispot vs. array timings"""
+    params = forecast.params
+    args = (
+        params['undercount'], round(1 / params['gamma_inf']), params['delay']
+    )
+    print(
+        f'{"counties":>9}{"epispot":>12}{"per county":>13}'
+        f'{"batched":>12}{"speedup":>9}'
+    )
+    for counties in COUNTIES:
+        cases, deaths = synthetic(counties)
+        check(cases, deaths, args)
+
+        rows = [(list(c), list(d)) for c, d in zip(cases, deaths)]
+        before = measure(
+            lambda: [historical(*row, *args) for row in rows], REPEAT
+        )
+        single = measure(lambda: [
+            forecast.historical(c, d, *args) for c, d in zip(cases, deaths)
+        ], REPEAT)
+        after = measure(
+            lambda: forecast.historical(cases, deaths, *args), REPEAT
+        )
+        print(
+            f'{counties:>9}{before * 1e3:>10.2f}ms{single * 1e3:>11.2f}ms'
+            f'{after * 1e3:>10.2f}ms{before / after:>8.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark vectorized processing against the original implementations
+
+Run with `python benchmarks/process.py`.
+"""
+
+# imports
+import numpy as np
+import pandas as pd
+
+from common import measure
+from core import population, process
+
+# constants
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+REPEAT = 5
+
+
+# original implementations
+def geoid2fips(df):
+    df['geoid'].fillna(0, inplace=True)
+    col = df['geoid'].copy()
+    df['fips'] = col.apply(lambda x: x[4:])
+    df.drop(columns=['geoid'], inplace=True)
+    return df
+
+def populate(df):
+    populations = pd.read_csv('data/populations.csv')
+    df = df.merge(populations, on='fips', how='left')
+    return df
+
+def remaining(df):
+    df.loc[df['county'] == 'New York City', 'fips'] = 'unique:nyc'
+    df.loc[df['county'] == 'Kansas City', 'fips'] = 'unique:kc'
+    df.loc[df['county'] == 'Joplin', 'fips'] = 'unique:jop'
+    return df
+
+def normalize(df):
+    p_cases = df['cases'] / df['population']
+    p_deaths = df['deaths'] / df['population']
+    death_rate = df['deaths'] / df['cases']
+    return p_cases, p_deaths, death_rate
+
+
+# functions
+def synthetic(size):
+    """Create a synthetic county frame with `size` rows"""
+    rng = np.random.default_rng(0)
+    fips = pd.read_csv('data/populations.csv', dtype={'fips': str})['fips']
+    fips = fips[~fips.str.startswith('unique')].to_numpy()
+    counties = np.array(['County', 'New York City', 'Kansas City', 'Joplin'])
+    return pd.DataFrame({
+        'geoid': 'USA-' + rng.choice(fips, size),
+        'county': rng.choice(counties, size, p=[0.97, 0.01, 0.01, 0.01]),
+        'cases': rng.integers(0, 100_000, size),
+        'deaths': rng.integers(0, 1_000, size),
+    })
+
+def steps(df):
+    """Pair each original step with its vectorized replacement"""
+    with_fips = geoid2fips(df.copy())
+    populated = populate(remaining(with_fips.copy()))
+    return {
+        'geoid2fips': (geoid2fips, process.geoid2fips, df),
+        'remaining': (remaining, process.remaining, with_fips),
+        'populate': (populate, process.populate, with_fips),
+        'normalize': (normalize, process.normalize, populated),
+    }
+
+def main():
+    """Print a table of original vs. vectorized timings"""
+    population.load()  # load populations once, as a worker would
+    print(f'{"step":<12}{"rows":>10}{"original":>12}{"new":>12}{"speedup":>9}')
+    for size in SIZES:
+        for name, (old, new, df) in steps(synthetic(size)).items():
+            # steps may modify their input, so each run gets a fresh copy
+            before, after = [
+                measure(step, REPEAT, lambda: (df.copy(),))
+                for step in [old, new]
+            ]
+            print(
+                f'{name:<12}{size:>10}{before * 1e3:>10.2f}ms'
+                f'{after * 1e3:>10.2f}ms{before / after:>8.1f}x'
+            )
+
+
+if __name__ == '__main__':
+    main()
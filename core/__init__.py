@@ -8,4 +8,6 @@ import numpy as np
 import pandas as pd
 
 # exports
-from . import find, get, process
+from . import (cache, display, encode, find, forecast, geometry, get, index,
+               ingest, normalize, payload, population, process, refresh,
+               scenarios, shared, store)
@@ -0,0 +1,106 @@
+"""Process-wide, memory-capped cache for parsed datasets and forecasts"""
+
+# imports
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from . import np, pd
+
+# constants
+CAPACITY = 512 * 2 ** 20  # maximum cached size, in bytes
+SAMPLE = 1_000  # object array elements measured when estimating sizes
+
+# cache state
+entries = OrderedDict()  # key -> (value, size), least recently used first
+pending = {}  # key -> Future, for values still being computed
+used = 0
+lock = threading.RLock()
+
+
+# functions
+def objects(value):
+    """Estimate the size of the Python objects an object array points to"""
+    if value.size == 0:
+        return 0
+    flat = value.ravel()
+    step = max(1, len(flat) // SAMPLE)
+    sample = flat[::step]
+    return int(sum(sys.getsizeof(v) for v in sample) / len(sample) * len(flat))
+
+def size(value):
+    """Estimate the in-memory size of a cached value, in bytes"""
+    match value:
+        case pd.DataFrame() | pd.Series():
+            return int(np.sum(value.memory_usage(deep=True)))
+        case np.memmap():  # shared between processes, not held in memory
+            return 0
+        case np.ndarray() if value.dtype == object:  # e.g. text columns
+            return value.nbytes + objects(value)
+        case np.ndarray():
+            return value.nbytes
+        case bytes():
+            return len(value)
+        case dict():
+            return sum(size(v) for v in value.values())
+        case list() | tuple():
+            return sum(size(v) for v in value)
+        case _:
+            return 0
+
+def evict():
+    """Drop least recently used entries until the cache fits its capacity"""
+    global used
+    while used > CAPACITY and len(entries) > 1:
+        _, (_, freed) = entries.popitem(last=False)
+        used -= freed
+
+def fetch(source, version, date, compute, kind='frame'):
+    """Return a cached value, computing and storing it on a miss"""
+    global used
+    key = (kind, source, version, date)
+
+    with lock:
+        # cache hit
+        if key in entries:
+            entries.move_to_end(key)
+            return entries[key][0]
+
+        # drop anything parsed from older artifacts
+        invalidate(keep=version)
+
+        # only one thread computes each value; others wait for its result
+        future = pending.get(key)
+        waiting = future is not None
+        if not waiting:
+            future = pending[key] = Future()
+
+    if waiting:
+        return future.result()
+
+    # cache miss, computed without holding up lookups of other keys
+    try:
+        value = compute()
+    except BaseException as error:
+        with lock:
+            del pending[key]
+        future.set_exception(error)
+        raise
+
+    cost = size(value)
+    with lock:
+        del pending[key]
+        entries[key] = (value, cost)
+        used += cost
+        evict()
+    future.set_result(value)
+    return value
+
+def invalidate(keep=None):
+    """Remove all entries, or all entries not matching a given version"""
+    global used
+    with lock:
+        for key in list(entries):
+            if keep is None or key[2] != keep:
+                used -= entries.pop(key)[1]
@@ -0,0 +1,44 @@
+"""Precomputed display columns for figures and hover text"""
+
+# imports
+from . import np, pd
+
+# constants
+PERCENT = ['p_cases', 'p_deaths', 'death_rate']
+PER_100K = ['cases_avg_per_100k', 'deaths_avg_per_100k']
+
+
+# functions
+def values(col, label):
+    """Format a data column for plotly display"""
+    if label in PERCENT:
+        return np.round(col * 100, 1).astype(str) + '%'
+    if label in PER_100K:
+        return np.round(col, 1).astype(str) + '/100k'
+
+def dates(col):
+    """Format a date column as '%-m/%-d', parsing each distinct date once"""
+    col = pd.Series(col)
+    distinct = col.unique()
+    formatted = pd.to_datetime(distinct).strftime('%-m/%-d')
+    return col.map(dict(zip(distinct, formatted)))
+
+def hover(df, source):
+    """Add map hover text for the latest day of a source"""
+    match source:
+        case 'cumulative': cases, deaths = 'p_cases', 'p_deaths'
+        case 'rolling': cases, deaths = PER_100K
+
+    df['text'] = df['county'] + ', ' + df['state'] \
+        + '<br>cases: ' + values(df[cases], cases) \
+        + '<br>deaths: ' + values(df[deaths], deaths) \
+        + '<br>fatality rate: ' + values(df['death_rate'], 'death_rate')
+    return df
+
+def labels(df):
+    """Add county-graph hover text for each metric of a history frame"""
+    date = dates(df['date']).to_numpy() + ': '
+    for label in PERCENT + PER_100K:
+        if label in df.columns:
+            df[f'{label}_text'] = date + values(df[label], label).to_numpy()
+    return df
@@ -0,0 +1,54 @@
+"""Fast JSON encoding, and response metrics for each callback"""
+
+# imports
+import threading
+
+import orjson
+import plotly.io as pio
+
+# encode figures and callback responses with orjson, which also serializes
+# NumPy arrays directly instead of converting them to lists first
+pio.json.config.default_engine = 'orjson'
+
+# running totals per callback output
+totals = {}
+lock = threading.Lock()
+
+
+# functions
+def dumps(value):
+    """Encode a value, including any NumPy arrays, as JSON bytes"""
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def loads(data):
+    """Decode JSON bytes or text"""
+    return orjson.loads(data)
+
+def load(path):
+    """Read and decode a JSON file"""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def record(output, size, compute, encode):
+    """Add one response's size, in bytes, and timings, in seconds"""
+    with lock:
+        entry = totals.setdefault(output, {
+            'calls': 0, 'bytes': 0, 'compute': 0.0, 'encode': 0.0,
+        })
+        entry['calls'] += 1
+        entry['bytes'] += size
+        entry['compute'] += compute
+        entry['encode'] += encode
+
+def metrics():
+    """Average response size and timings of each callback so far"""
+    with lock:
+        return {
+            output: {
+                'calls': entry['calls'],
+                'bytes': entry['bytes'] / entry['calls'],
+                'compute_ms': entry['compute'] / entry['calls'] * 1e3,
+                'encode_ms': entry['encode'] / entry['calls'] * 1e3,
+            }
+            for output, entry in totals.items()
+        }
@@ -1,46 +1,41 @@
 """Utilities for finding files and directories."""
 
 # imports
-import os
-from datetime import datetime, timedelta
-
-from . import get, np, pd
+from . import cache, display, get, index, refresh, shared, store
 
 
 # functions
 def data(source='cumulative'):
     """Fetch county data from the NYTimes COVID-19 dataset"""
 
-    # get last updated date
-    last_update = datetime.utcnow() - timedelta(hours=29)
-    last_update = last_update.strftime('%Y-%m-%d')
-
-    # fetch data
-    if last_update != get.last_update():  # cached data is outdated
-        cumulative, rolling = get.data(last_update)
-        match source:
-            case 'cumulative': return cumulative
-            case 'rolling': return rolling
-
-    else:  # cached data is up-to-date
-        last_update = '2023-03-23'  # use the latest reported data
-        full = pd.read_csv(
-            f'artifacts/{source}.csv',
-            dtype={'fips': str}
-        )
-        relevant = full[full['date'] == last_update].copy()
+    # refresh in the background, serving the last good artifacts meanwhile
+    refresh.start()
+    if refresh.missing():  # nothing to serve yet
+        refresh.run(block=True)
+
+    # use the latest reported data, listed once per version
+    version = get.last_update()
+    latest = cache.fetch(
+        source, version, None, lambda: store.latest(source), kind='latest'
+    )
+
+    def parse():
+        if shared.ENABLED:
+            return display.hover(shared.latest(source), source)
+        relevant = store.read(source, date=latest)
         relevant.drop(columns=['date'], inplace=True)
-        return relevant
+        return display.hover(store.decode(relevant), source)
+
+    return cache.fetch(source, version, latest, parse)
 
-def historical(fips, source='cumulative'):
-    """Fetch historical data for a given county"""
+def historical(fips, source='cumulative', columns=None):
+    """Fetch zero-copy views of a county's date-sorted history, by column"""
 
-    # check if artifacts/{source}.csv exists
-    if not os.path.exists(f'artifacts/{source}.csv'):
-        data()
+    # check if any partitions exist
+    if refresh.missing():
+        refresh.run(block=True)
 
-    # fetch data and sort by date
-    full = pd.read_csv(f'artifacts/{source}.csv', dtype={'fips': str})
-    full.sort_values(by=['date'], inplace=True)
-    full.index = np.arange(len(full))
-    return full[full['fips'] == fips]
+    # look up the county's date-sorted history in the FIPS index
+    if columns is not None:
+        columns = list(dict.fromkeys(['date', *columns]))
+    return index.lookup(fips, source, columns=columns)
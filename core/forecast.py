@@ -0,0 +1,309 @@
+"""Vectorized compartmental forecasts for every county at once"""
+
+# imports
+import json
+from functools import lru_cache
+
+from epispot import comps, models, pre
+from epispot.estimates.getters import query
+
+from . import cache, get, index, normalize, np, pd
+
+# constants
+HORIZON = 14  # days projected beyond the latest data
+STEPS = 4  # Runge-Kutta steps per day
+SAMPLES = 500  # parameter sets per ensemble
+SPREAD = 0.25  # relative range of sampled parameters around a preset
+PERCENTILES = [5, 50, 95]  # ensemble band edges and median
+SOLVERS = ['epispot', 'RK4']  # selectable county forecast solvers
+
+# compartments of each model, in order
+MODELS = {
+    'SIR': ['susceptible', 'infected', 'removed'],
+    'SEIR': ['susceptible', 'exposed', 'infected', 'removed'],
+    'SIRD': ['susceptible', 'infected', 'recovered', 'dead'],
+    'SEIRD': ['susceptible', 'exposed', 'infected', 'recovered', 'dead'],
+}
+
+# forecasting parameters, by transmission behavior
+BEHAVIORS = {
+    'Low Transmission': 'low',
+    'Average': 'average',
+    'High Transmission': 'high',
+}
+params = {
+    'gamma_inf': query(
+        ('SARS-CoV-2', 'Mehra et al. 2020', 'gamma')
+    )(0),
+    'delay': 7,
+    'undercount': 0.2,
+    'low': {
+        'R_0': 1.5,
+        'delta': 0.1,
+        'alpha': 0.0075,
+        'rho': 0.07,
+    },
+    'average': {
+        'R_0': 2.25,
+        'delta': 0.2,
+        'alpha': 0.01,
+        'rho': 0.1,
+    },
+    'high': {
+        'R_0': 3,
+        'delta': 0.3,
+        'alpha': 0.015,
+        'rho': 0.14,
+    }
+}
+
+
+# functions
+def rates(behavior):
+    """Look up model rates for a transmission behavior"""
+    return {**params[BEHAVIORS[behavior]], 'gamma': params['gamma_inf']}
+
+def sample(behavior, size=SAMPLES, seed=0):
+    """Draw rates and undercounts uniformly around a behavior's preset"""
+    rng = np.random.default_rng(seed)
+    preset = {**rates(behavior), 'undercount': params['undercount']}
+    return {
+        key: value * rng.uniform(1 - SPREAD, 1 + SPREAD, size)
+        if key != 'gamma' else value  # keep the infectious period fixed
+        for key, value in preset.items()
+    }
+
+def history(source='cumulative'):
+    """Align all counties' cumulative cases and deaths on one date axis"""
+    columns = index.load(source)['columns']
+    fips, rows = np.unique(columns['fips'], return_inverse=True)
+    dates, days = np.unique(columns['date'], return_inverse=True)
+
+    # counts carry forward over missing days, and are zero before the first
+    grids = {}
+    for name in ['cases', 'deaths']:
+        grid = np.full((len(fips), days.max() + 1), np.nan)
+        grid[rows, days] = columns[name]
+        grids[name] = pd.DataFrame(grid).ffill(axis=1).fillna(0).to_numpy()
+
+    population = np.full(len(fips), np.nan)
+    population[rows] = columns['population']
+    return fips, dates, grids['cases'], grids['deaths'], population
+
+def historical(cases, deaths, undercount, period, delay):
+    """Estimate active, dead, and recovered counts from reported totals"""
+
+    # process available data
+    infected_deltas = normalize.deltas(normalize.count(cases, undercount))
+    fatalities_deltas = normalize.deltas(normalize.count(deaths, undercount))
+
+    # normalize data
+    infected = normalize.active(infected_deltas, period, delay=delay)
+    infected_deltas = normalize.shift(infected_deltas, delay)
+    fatalities_deltas = normalize.shift(fatalities_deltas, delay)
+
+    # extract missing data
+    fatalities_deltas = normalize.bound(
+        infected, infected_deltas, fatalities_deltas
+    )
+    recovered_deltas = normalize.recovered(
+        infected, infected_deltas, fatalities_deltas
+    )
+
+    # get cumulative data
+    fatalities = normalize.cumulative(fatalities_deltas)
+    recovered = normalize.cumulative(recovered_deltas)
+
+    return infected, fatalities, recovered
+
+def start(model, historical, n):
+    """Arrange the latest historical counts as a model's starting state"""
+    infected, fatalities, recovered = (
+        np.asarray(counts)[..., -1] for counts in historical
+    )
+    remaining = n - (infected + fatalities + recovered)
+    none = np.zeros_like(remaining)
+
+    match model:
+        case 'SIR': state = [remaining, infected, fatalities + recovered]
+        case 'SEIR':
+            state = [remaining, none, infected, fatalities + recovered]
+        case 'SIRD': state = [remaining, infected, recovered, fatalities]
+        case 'SEIRD':
+            state = [remaining, none, infected, recovered, fatalities]
+
+    return np.stack(state, axis=-1)
+
+def derivative(model, y, n, rates):
+    """Rates of change of each compartment, for rows of model states"""
+    gamma = rates['gamma']
+    beta = rates['R_0'] * gamma
+    susceptible = y[:, 0]
+    infected = y[:, MODELS[model].index('infected')]
+    new = beta * susceptible * infected / n
+
+    # infected people recover or die, leaving at a total rate gamma
+    leaving = gamma * infected
+    if model in ['SIRD', 'SEIRD']:
+        dying = rates['alpha'] * rates['rho'] * infected
+    if model in ['SEIR', 'SEIRD']:
+        exposed = rates['delta'] * y[:, 1]
+
+    match model:
+        case 'SIR': flows = [-new, new - leaving, leaving]
+        case 'SEIR':
+            flows = [-new, new - exposed, exposed - leaving, leaving]
+        case 'SIRD':
+            flows = [-new, new - leaving, leaving - dying, dying]
+        case 'SEIRD':
+            flows = [
+                -new, new - exposed, exposed - leaving, leaving - dying,
+                dying
+            ]
+
+    return np.stack(flows, axis=-1)
+
+def create_seird(r_0, gamma, n, alpha, rho, delta):
+    """Create and returned a pre-compiled SEIRD model"""
+
+    # compile compartments
+    susceptible = comps.Susceptible(r_0, gamma, n)
+    exposed = comps.Exposed()
+    infected = comps.Infected()
+    recovered = comps.Recovered()
+    dead = comps.Dead()
+
+    # compile parameters
+    matrix = np.empty((5, 5), dtype=tuple)
+    matrix.fill((1.0, 1.0))  # default probability and rate
+
+    matrix[1][2] = (1, delta)
+
+    recovery_rate = (gamma - alpha * rho) / (1 - alpha)
+    matrix[2][3] = (1 - alpha, recovery_rate)  # I => R
+    matrix[2][4] = (alpha, rho)  # I => D
+
+    # compile model
+    seird_model = models.Model(n)
+    seird_model.add(susceptible, [1], matrix[0])
+    seird_model.add(exposed, [2], matrix[1])
+    seird_model.add(infected, [3, 4], matrix[2])
+    seird_model.add(recovered, [], matrix[3])
+    seird_model.add(dead, [], matrix[4])
+    seird_model.compile()
+
+    return seird_model
+
+@lru_cache(maxsize=64)
+def compiled(model, r_0, gamma, alpha, rho, delta):
+    """Build and compile an epispot model once per worker and rate set
+
+    Models are compiled for a population of one, and integrate shares of a
+    county's population: every compartment's rate of change scales with
+    the population, so one model serves every county.
+    """
+    match model:
+        case 'SIR': return pre.sir(r_0, gamma, 1.0)
+        case 'SEIR': return pre.seir(r_0, gamma, 1.0, delta)
+        case 'SIRD': return pre.sird(r_0, gamma, 1.0, alpha, rho)
+        case 'SEIRD': return create_seird(r_0, gamma, 1.0, alpha, rho, delta)
+
+def simulate(model, state, n, rates, days):
+    """Integrate one county with epispot, reusing a compiled model"""
+    shared = compiled(
+        model, rates['R_0'], rates['gamma'], rates['alpha'], rates['rho'],
+        rates['delta']
+    )
+
+    # shared models are only integrated, never rebound: each county's
+    # state is scaled to shares of its population, and back to people
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = np.asarray(state, dtype=np.float64) / n
+    predicted = shared.integrate(range(days), starting_state=shares)
+    return np.asarray(predicted) * n  # (days, compartments)
+
+def integrate(model, state, n, rates, days, steps=STEPS, method='rk4'):
+    """Integrate a model for many counties in fixed steps
+
+    `method` is 'rk4' for Runge-Kutta, or 'euler' for the forward Euler
+    steps taken by epispot's `Model.integrate` (with `steps=1`).
+    """
+
+    # each row is one county or parameter set; `n` and `rates` may hold
+    # either one value for all rows or one value per row
+    y = np.atleast_2d(np.asarray(state, dtype=np.float64))
+    n = np.atleast_1d(np.asarray(n, dtype=np.float64))
+    h = 1 / steps
+    f = lambda y: derivative(model, y, n, rates)
+
+    def rk4(y):
+        k1 = f(y)
+        k2 = f(y + h / 2 * k1)
+        k3 = f(y + h / 2 * k2)
+        k4 = f(y + h * k3)
+        return y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+    match method:
+        case 'rk4': step = rk4
+        case 'euler': step = lambda y: y + h * f(y)
+
+    out = np.empty((days,) + y.shape)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for day in range(days):  # counties without a population stay NaN
+            for _ in range(steps):
+                y = step(y)
+            out[day] = y
+
+    return out  # (days, counties, compartments), from the day after `state`
+
+def solve(model, state, n, rates, days, solver='epispot'):
+    """Forecast one county, or rows of counties, with a named solver
+
+    'RK4' integrates every row at once from the closed-form rates, and
+    'epispot' integrates each row with a compiled epispot model.
+    """
+    match solver:
+        case 'RK4': predicted = integrate(model, state, n, rates, days)
+        case 'epispot':
+            rows = np.atleast_2d(state)
+            sizes = np.broadcast_to(n, len(rows))
+            predicted = np.stack([
+                simulate(model, row, size, rates, days)
+                for row, size in zip(rows, sizes)
+            ], axis=1)
+
+    return predicted if np.ndim(state) > 1 else predicted[:, 0]
+
+def project(model, rates, undercount, delay, source='cumulative'):
+    """Project each county's share of people ever infected, HORIZON days out"""
+
+    def compute():
+        fips, _, cases, deaths, population = history(source)
+        period = round(1 / rates['gamma'])
+        counts = historical(cases, deaths, undercount, period, delay)
+        state = start(model, counts, population)
+
+        # historical estimates end `delay` days before the latest data
+        predicted = integrate(model, state, population, rates, HORIZON + delay)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = (population - predicted[-1, :, 0]) / population
+        return pd.Series(share, index=fips, name='p_projected')
+
+    # results are reused until the data or any forecasting parameter changes
+    settings = (model, json.dumps([rates, undercount, delay], sort_keys=True))
+    return cache.fetch(
+        source, get.last_update(), settings, compute, kind='projection'
+    )
+
+def ensemble(model, historical, n, samples, days):
+    """Integrate sampled parameter sets for one county in a single batch"""
+
+    # historical estimates scale linearly with (1 + undercount)
+    scale = (1 + samples['undercount']) / (1 + params['undercount'])
+    counts = [
+        np.multiply.outer(scale, np.asarray(series)[-1:])
+        for series in historical
+    ]
+
+    predicted = integrate(model, start(model, counts, n), n, samples, days)
+    return np.percentile(predicted, PERCENTILES, axis=1)
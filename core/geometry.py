@@ -0,0 +1,236 @@
+"""Simplified, multi-resolution county geometry for map views"""
+
+# imports
+import os
+
+from . import encode, get, np, payload
+
+# detail levels: (maximum map zoom, tolerance in degrees, decimal places)
+LEVELS = {
+    'low': (3, 0.02, 3),  # national and Alaska views
+    'medium': (5, 0.005, 4),  # single-state views
+    'high': (float('inf'), 0.001, 5),  # island close-ups
+}
+
+# margin around a map region within which counties are still sent, degrees
+MARGIN = 1
+
+# simplified GeoJSON, bounding boxes, clipped subsets, and their
+# precompressed JSON, per process; geometry never changes while it runs
+levels = {}
+extents = {}
+clipped = {}
+payloads = {}
+
+
+# functions
+def path(name):
+    """Return the artifact path for a detail level's simplified GeoJSON"""
+    _, tolerance, places = LEVELS[name]
+    return f'artifacts/geometry/arcs-{tolerance}-{places}.json'
+
+def level(zoom):
+    """Pick the coarsest detail level suitable for a map zoom"""
+    for name, (max_zoom, _, _) in LEVELS.items():
+        if zoom <= max_zoom:
+            return name
+
+def simplify(points, tolerance):
+    """Simplify a line of (lon, lat) points with Douglas-Peucker"""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        # distance of each interior point from the chord (start, end)
+        a, b = points[start], points[end]
+        inner = points[start + 1:end] - a
+        chord = b - a
+        length = np.hypot(*chord)
+        if length == 0:  # closed ring: measure from the shared endpoint
+            distance = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            cross = chord[0] * inner[:, 1] - chord[1] * inner[:, 0]
+            distance = np.abs(cross) / length
+
+        # keep the farthest point if it is outside the tolerance
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack += [(start, split), (split, end)]
+
+    return points[keep]
+
+def quantize(coordinates, places):
+    """Round a ring's points, dropping duplicates and its closing point"""
+    points = np.round(np.asarray(coordinates, dtype=np.float64), places)
+
+    # drop consecutive duplicates created by quantization
+    distinct = np.any(np.diff(points, axis=0) != 0, axis=1)
+    points = points[np.append(True, distinct)]
+    if len(points) > 1 and np.all(points[0] == points[-1]):
+        points = points[:-1]
+    return [tuple(point) for point in points.tolist()]
+
+def junctions(rings):
+    """Find the points where borders shared by quantized rings meet
+
+    Between two junctions, every ring through a point continues to the same
+    neighbors, so a border shared by two counties is one run of points.
+    """
+    neighbors = {}
+    for points in rings:
+        for i, point in enumerate(points):
+            near = neighbors.setdefault(point, set())
+            near.add(points[i - 1])
+            near.add(points[(i + 1) % len(points)])
+    return {point for point, near in neighbors.items() if len(near) > 2}
+
+def ring(points, cuts, tolerance):
+    """Simplify a quantized ring one arc at a time, between junctions"""
+    if len(points) < 3:  # too small to simplify
+        return [list(point) for point in points + points[:1]]
+
+    # walk the ring from its first junction back around to it; rings with
+    # none start from their least point, so shared ones start alike
+    at = [i for i, point in enumerate(points) if point in cuts]
+    start = at[0] if at else points.index(min(points))
+    walk = points[start:] + points[:start + 1]
+    stops = [i - start for i in at] or [0]
+
+    # arcs are simplified in one direction, so a border shared by two
+    # counties keeps the same points in both
+    simplified = walk[:1]
+    for first, last in zip(stops, stops[1:] + [len(points)]):
+        arc = walk[first:last + 1]
+        reverse = arc[::-1] < arc
+        kept = simplify(np.array(arc[::-1] if reverse else arc), tolerance)
+        kept = kept[::-1] if reverse else kept
+        simplified += kept[1:].tolist()
+
+    if len(simplified) < 4:  # too small to simplify; keep its outline
+        simplified = walk
+    return [list(point) for point in simplified]
+
+def polygons(geometry):
+    """Return a geometry's polygons, each a list of rings"""
+    match geometry['type']:
+        case 'Polygon': return [geometry['coordinates']]
+        case 'MultiPolygon': return geometry['coordinates']
+        case _: return []
+
+def feature(source, rings):
+    """Return a copy of a GeoJSON feature with its polygons' rings replaced"""
+    geometry = source['geometry']
+    match geometry['type']:
+        case 'Polygon': coordinates = rings[0]
+        case 'MultiPolygon': coordinates = rings
+        case _: coordinates = geometry['coordinates']
+
+    return {
+        **source,
+        'geometry': {'type': geometry['type'], 'coordinates': coordinates},
+    }
+
+def build(name, counties=None):
+    """Precompute simplified county GeoJSON for a detail level"""
+    _, tolerance, places = LEVELS[name]
+    counties = counties or get.counties()
+
+    # quantize every ring, then find where shared borders meet
+    quantized = [
+        [
+            [quantize(coordinates, places) for coordinates in polygon]
+            for polygon in polygons(source['geometry'])
+        ]
+        for source in counties['features']
+    ]
+    cuts = junctions(
+        points for shapes in quantized
+        for polygon in shapes for points in polygon
+    )
+
+    simplified = {
+        **counties,
+        'features': [
+            feature(source, [
+                [ring(points, cuts, tolerance) for points in polygon]
+                for polygon in shapes
+            ])
+            for source, shapes in zip(counties['features'], quantized)
+        ],
+    }
+
+    # write atomically, so concurrent builders can't corrupt the file
+    os.makedirs('artifacts/geometry', exist_ok=True)
+    with open(f'{path(name)}.{os.getpid()}.tmp', 'wb') as f:
+        f.write(encode.dumps(simplified))
+    os.replace(f'{path(name)}.{os.getpid()}.tmp', path(name))
+    return simplified
+
+def counties(name):
+    """Return simplified county GeoJSON for a detail level"""
+    if name not in levels:
+        if os.path.isfile(path(name)):
+            levels[name] = encode.load(path(name))
+        else:
+            levels[name] = build(name)
+    return levels[name]
+
+def points_of(coordinates):
+    """Yield every (lon, lat) pair in nested GeoJSON coordinates"""
+    if isinstance(coordinates[0], (int, float)):
+        yield coordinates[:2]
+    else:
+        for nested in coordinates:
+            yield from points_of(nested)
+
+def bounds(name):
+    """Index the bounding box (west, south, east, north) of every feature"""
+    if name not in extents:
+        features = counties(name)['features']
+        boxes = np.empty((len(features), 4))
+        for i, source in enumerate(features):
+            points = np.array(
+                list(points_of(source['geometry']['coordinates']))
+            )
+            boxes[i] = [*points.min(axis=0), *points.max(axis=0)]
+        extents[name] = boxes
+    return extents[name]
+
+def clip(name, region):
+    """Return GeoJSON and feature IDs for counties within a map region"""
+    key = (name, tuple(region))
+    if key not in clipped:
+        features = counties(name)['features']
+        boxes = bounds(name)
+
+        # keep features whose bounding box overlaps any box of the region
+        inside = np.zeros(len(features), dtype=bool)
+        for west, south, east, north in region:
+            inside |= (
+                (boxes[:, 0] <= east + MARGIN)
+                & (boxes[:, 2] >= west - MARGIN)
+                & (boxes[:, 1] <= north + MARGIN)
+                & (boxes[:, 3] >= south - MARGIN)
+            )
+
+        subset = [source for source, keep in zip(features, inside) if keep]
+        clipped[key] = (
+            {**counties(name), 'features': subset},
+            {source['id'] for source in subset},
+        )
+    return clipped[key]
+
+def encoded(name, region=None):
+    """Return precompressed county GeoJSON for a level, or a region of it"""
+    key = (name, None if region is None else tuple(region))
+    if key not in payloads:
+        geojson = counties(name) if region is None else clip(name, region)[0]
+        payloads[key] = payload.build(encode.dumps(geojson))
+    return payloads[key]
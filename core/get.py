@@ -1,34 +1,53 @@
 """Helper functions for fetching relevant data"""
 
 # imports
-import json
 import os
 
-from . import np, pd, process
+from . import cache, encode, np, pd, process, shared, store
+
+# constants
+FEEDS = {
+    'cumulative':
+        'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties-recent.csv',  # noqa: E501
+    'rolling':
+        'https://raw.githubusercontent.com/nytimes/covid-19-data/master/rolling-averages/us-counties-recent.csv',  # noqa: E501
+}
+
+# latest stamp, read again only when artifacts/last-update.txt is replaced
+stamped = (None, None)  # (file identity, date)
 
 
 # functions
 def last_update():
     """Fetch last updated date from artifacts/last-update.txt"""
+    global stamped
 
     # check if file exists
-    if not os.path.isfile('artifacts/last-update.txt'):
+    try:
+        info = os.stat('artifacts/last-update.txt')
+    except FileNotFoundError:
         if not os.path.isdir('artifacts'):  # create containing directory
             os.mkdir('artifacts')
         with open('artifacts/last-update.txt', 'w+') as f:  # create file
             f.write('never')
+        info = os.stat('artifacts/last-update.txt')
 
-    # read file
-    with open('artifacts/last-update.txt', 'r') as f:
-        return f.read()
+    # read file, unless it is unchanged since it was last read
+    identity = (info.st_ino, info.st_mtime_ns, info.st_size)
+    if stamped[0] != identity:
+        with open('artifacts/last-update.txt', 'r') as f:
+            stamped = (identity, f.read())
+    return stamped[1]
 
-def cumulative():
+def download(url):
+    """Download a remote CSV feed"""
+    return pd.read_csv(url, dtype={'fips': str})
+
+def cumulative(fetch=download):
     """Fetch and process cumulative county data"""
 
     # fetch data
-    url = \
-        'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties-recent.csv'  # noqa: E501
-    df = pd.read_csv(url, dtype={'fips': str})
+    df = fetch(FEEDS['cumulative'])
     df.drop(df[df['county'] == 'Unknown'].index, inplace=True)
 
     # process data
@@ -50,13 +69,11 @@ def cumulative():
 
     return df
 
-def rolling():
+def rolling(fetch=download):
     """Fetch and process rolling averages of new county data"""
 
     # fetch data
-    url = \
-        'https://raw.githubusercontent.com/nytimes/covid-19-data/master/rolling-averages/us-counties-recent.csv'  # noqa: E501
-    df = pd.read_csv(url, dtype={'fips': str})
+    df = fetch(FEEDS['rolling'])
     df.drop(columns=['cases', 'deaths'], inplace=True)
     df['cases'] = df['cases_avg']
     df['deaths'] = df['deaths_avg']
@@ -82,24 +99,43 @@ def rolling():
 
     return df
 
-def data(date):
-    """Fetch most recent data from the NYTimes COVID-19 dataset"""
-
-    # get data
-    df1 = cumulative()
-    df2 = rolling()
-
-    # write data
-    df1.to_csv('artifacts/cumulative.csv', index=False)
-    df2.to_csv('artifacts/rolling.csv', index=False)
-
-    # change last updated date
-    with open('artifacts/last-update.txt', 'w') as f:
+def stamp(date):
+    """Record the date of the latest refresh in artifacts/last-update.txt"""
+    with open('artifacts/.last-update.txt', 'w') as f:
         f.write(date)
-
-    return df1[df1['date'] == date], df2[df2['date'] == date]
+    os.replace('artifacts/.last-update.txt', 'artifacts/last-update.txt')
+    cache.invalidate()
+
+def digests(df):
+    """Hash raw feed rows by date, to detect new or revised days"""
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    return {
+        date: format(digest, 'x')
+        for date, digest in hashes.groupby(df['date']).sum().items()
+    }
+
+def delta(source, raw):
+    """Select raw rows of days that are new or revised since the last ingest"""
+    current = digests(raw)
+    previous = store.watermark(source)
+    changed = [
+        date for date, digest in current.items()
+        if previous['digests'].get(date) != digest
+    ]
+    watermark = {
+        'latest': max(current, default=previous['latest']),
+        'digests': {**previous['digests'], **current},
+    }
+    return raw[raw['date'].isin(changed)], watermark
+
+def transform(source, raw):
+    """Process an already-fetched raw feed for a given source"""
+    match source:
+        case 'cumulative': return cumulative(lambda url: raw.copy())
+        case 'rolling': return rolling(lambda url: raw.copy())
 
 def counties():
     """Return county GeoJSON data"""
-    with open('data/counties.geojson', 'r') as f:
-        return json.load(f)
+    if shared.ENABLED:
+        return shared.counties()
+    return encode.load('data/counties.geojson')
@@ -0,0 +1,48 @@
+"""Per-county time-series index over stored artifacts"""
+
+# imports
+from . import cache, display, get, np, shared, store
+
+
+# functions
+def build(source):
+    """Build a FIPS -> date-sorted slice index for a given source"""
+
+    # read and group rows by county, then by date
+    if shared.ENABLED:  # attach to arrays already sorted this way
+        columns = shared.history(source)
+    else:
+        df = store.decode(store.read(source))
+        df.sort_values(by=['fips', 'date'], inplace=True, kind='stable')
+        df = display.labels(df)
+        columns = {
+            col: np.ascontiguousarray(df[col].to_numpy())
+            for col in df.columns
+        }
+
+    # locate contiguous runs of each FIPS code
+    fips = columns['fips']
+    codes, starts = np.unique(fips, return_index=True)
+    stops = np.append(starts[1:], len(fips))
+
+    return {
+        'slices': {
+            code: slice(start, stop)
+            for code, start, stop in zip(codes, starts, stops)
+        },
+        'columns': columns,
+    }
+
+def load(source):
+    """Return the index for a source, rebuilding it if artifacts changed"""
+    return cache.fetch(
+        source, get.last_update(), None, lambda: build(source), kind='index'
+    )
+
+def lookup(fips, source='cumulative', columns=None):
+    """Return zero-copy views of a county's history for each column"""
+    index = load(source)
+    span = index['slices'].get(fips, slice(0, 0))
+    if columns is None:
+        columns = index['columns'].keys()
+    return {col: index['columns'][col][span] for col in columns}
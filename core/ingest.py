@@ -0,0 +1,175 @@
+"""Concurrent fetching and processing of the NYTimes feeds"""
+
+# imports
+import fcntl
+import http.client
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import get, pd, population, store
+
+# constants
+TIMEOUT = 60  # seconds before a stalled download is abandoned
+WORKERS = 2  # maximum concurrent downloads and processing jobs
+CHUNKSIZE = 50_000  # rows held in memory at once while streaming
+
+# idle HTTP connections, reused across downloads
+idle = {}
+lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+# functions
+def connect(scheme, host):
+    """Check out an idle connection to a host, or open a new one"""
+    with lock:
+        if idle.get((scheme, host)):
+            return idle[(scheme, host)].pop()
+    match scheme:
+        case 'https': return http.client.HTTPSConnection(host, timeout=TIMEOUT)
+        case 'http': return http.client.HTTPConnection(host, timeout=TIMEOUT)
+
+def release(scheme, host, connection):
+    """Return a connection to the idle pool for later reuse"""
+    with lock:
+        idle.setdefault((scheme, host), []).append(connection)
+
+def fetch(url):
+    """Download a CSV feed over a pooled, persistent HTTP connection"""
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+
+    # retry once on a fresh connection if a pooled one has gone stale
+    for attempt in range(2):
+        connection = connect(parts.scheme, parts.netloc)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            body = response.read()
+            break
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            if attempt == 1:
+                raise
+
+    if response.status != 200:
+        connection.close()
+        raise OSError(f'GET {url} returned {response.status}')
+    release(parts.scheme, parts.netloc, connection)
+    return pd.read_csv(io.BytesIO(body), dtype={'fips': str})
+
+def pipeline(source, feeds, fetch, processes):
+    """Fetch and process one source, timing each stage"""
+    timing = {}
+    df = None
+
+    # download
+    start = time.perf_counter()
+    raw = fetch(feeds[source])
+    timing['fetch'] = time.perf_counter() - start
+
+    # find new or revised days
+    start = time.perf_counter()
+    rows, watermark = get.delta(source, raw)
+    timing['diff'] = time.perf_counter() - start
+
+    # process in a separate process, off the GIL
+    start = time.perf_counter()
+    if len(rows) > 0:
+        df = processes.submit(get.transform, source, rows).result()
+        timing['process'] = time.perf_counter() - start
+
+        # report counties that could not be normalized by population
+        missing = population.validate(df['fips'])
+        if missing:
+            logger.warning('%s: no population for %s', source, missing)
+
+    timing['rows'] = len(rows)
+    return df, watermark, timing
+
+def write(source, df, watermark, timing):
+    """Store one source's processed rows, timing the write"""
+    if df is not None:
+        start = time.perf_counter()
+        store.merge(df, source, watermark)
+        timing['write'] = time.perf_counter() - start
+
+    logger.info('ingested %s: %s', source, timing)
+    return timing
+
+def run(date, fetch=fetch, feeds=get.FEEDS, workers=WORKERS):
+    """Concurrently refresh all sources and report per-source timing"""
+    sources = list(feeds)
+    # refreshes run in threads of server workers, which aren't safe to fork
+    forkserver = multiprocessing.get_context('forkserver')
+    with ThreadPoolExecutor(workers) as threads, \
+            ProcessPoolExecutor(workers, mp_context=forkserver) as processes:
+        results = list(threads.map(
+            lambda source: pipeline(source, feeds, fetch, processes),
+            sources
+        ))
+
+    # write one source at a time, once every source has been processed:
+    # pyarrow's pandas conversion can fail when first used by two threads
+    # at once, and a failed source then leaves the others unpublished too
+    timings = {
+        source: write(source, *result)
+        for source, result in zip(sources, results)
+    }
+
+    get.stamp(date)
+    return timings
+
+def stream(source, url=None, chunksize=CHUNKSIZE):
+    """Ingest a feed chunk by chunk, holding at most `chunksize` raw rows"""
+    reader = pd.read_csv(
+        url or get.FEEDS[source], dtype={'fips': str}, chunksize=chunksize
+    )
+    digests = {}
+
+    def frames():
+        for chunk in reader:
+            # digests are sums of row hashes, so they combine across chunks
+            for date, digest in get.digests(chunk).items():
+                total = int(digests.get(date, '0'), 16) + int(digest, 16)
+                digests[date] = format(total % 2 ** 64, 'x')
+            yield get.transform(source, chunk)
+
+    with reader:
+        path = store.stream(frames(), source)
+    try:
+        store.mark(path, {
+            'latest': max(digests, default=None),
+            'digests': digests,
+        })
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    store.publish(source, path)
+
+
+if __name__ == '__main__':
+    from .refresh import target
+
+    # rebuild sources from their full feeds, waiting for (and then holding
+    # off) any refresh by a running server, like refresh.run
+    logging.basicConfig(level=logging.INFO)
+    os.makedirs('artifacts', exist_ok=True)
+    with open('artifacts/.refresh.lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        for source in sys.argv[1:] or list(get.FEEDS):
+            start = time.perf_counter()
+            stream(source)
+            logger.info(
+                'streamed %s in %.2fs', source, time.perf_counter() - start
+            )
+        get.stamp(target())
+        fcntl.flock(f, fcntl.LOCK_UN)
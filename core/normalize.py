@@ -0,0 +1,55 @@
+"""Array versions of epispot's normalization, along the last (time) axis"""
+
+# imports
+from . import np
+
+
+# functions
+def count(cases, percent):
+    """Under or overcount cases by a given fraction"""
+    return np.asarray(cases, dtype=np.float64) * (1 + percent)
+
+def deltas(cumulative):
+    """Convert cumulative counts to new counts per day"""
+    cumulative = np.asarray(cumulative, dtype=np.float64)
+    return np.diff(cumulative, axis=-1, prepend=0)
+
+def active(deltas, period, delay=0):
+    """Take a trailing sum of new cases over the infectious period"""
+    deltas = np.asarray(deltas, dtype=np.float64)
+    days = np.arange(deltas.shape[-1] - delay)
+
+    # differences of a running total, starting from zero
+    total = np.cumsum(deltas, axis=-1)
+    total = np.concatenate(
+        [np.zeros(deltas.shape[:-1] + (1,)), total], axis=-1
+    )
+    stop = days + delay + 1
+    start = np.maximum(days - period + delay, 0)
+    return total[..., stop] - total[..., start]
+
+def shift(count, delay):
+    """Drop the first `delay` days of counts"""
+    return np.asarray(count)[..., delay:]
+
+def removed(active, deltas):
+    """Net number of people leaving the active compartment each day"""
+    return -(np.diff(active, axis=-1) - deltas[..., 1:])
+
+def bound(active, deltas, deaths):
+    """Bound new deaths per day by the number of people who left"""
+    deaths = np.asarray(deaths, dtype=np.float64)
+    bounded = deaths.copy()
+    bounded[..., 1:] = np.minimum(deaths[..., 1:], removed(active, deltas))
+    return bounded
+
+def recovered(active, deltas, deaths):
+    """Calculate new recoveries per day from active cases and deaths"""
+    deaths = np.asarray(deaths, dtype=np.float64)
+    out = np.zeros(np.shape(active))
+    out[..., 1:] = removed(active, deltas) - deaths[..., 1:]
+    return out
+
+def cumulative(deltas):
+    """Convert new counts per day to cumulative counts"""
+    return np.cumsum(deltas, axis=-1)
@@ -0,0 +1,23 @@
+"""Precompressed, content-hashed JSON responses for HTTP caching"""
+
+# imports
+import gzip
+import hashlib
+
+try:  # optional; responses fall back to gzip without it
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# functions
+def build(data):
+    """Hash encoded JSON and compress it once for every supported encoding"""
+    payload = {
+        'etag': hashlib.sha256(data).hexdigest()[:16],
+        'identity': data,
+        'gzip': gzip.compress(data, compresslevel=9),
+    }
+    if brotli is not None:
+        payload['br'] = brotli.compress(data, quality=11)
+    return payload
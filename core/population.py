@@ -0,0 +1,36 @@
+"""Registry of county populations, indexed by FIPS ordinal"""
+
+# imports
+from . import np, pd
+
+# registry, loaded once per process
+codes = None  # pd.Index of FIPS codes; a code's position is its ordinal
+counts = None  # populations, indexed by ordinal
+
+
+# functions
+def load():
+    """Parse data/populations.csv into the registry, once"""
+    global codes, counts
+    if codes is None:
+        table = pd.read_csv('data/populations.csv', dtype={'fips': str})
+        table.sort_values(by=['fips'], inplace=True)
+        codes = pd.Index(table['fips'])
+        counts = table['population'].to_numpy(np.int32)
+    return codes, counts
+
+def ordinals(fips):
+    """Map FIPS codes (including `unique:*` regions) to ordinals, or -1"""
+    return load()[0].get_indexer(fips)
+
+def lookup(fips):
+    """Return the population of each FIPS code, with NaN where unknown"""
+    found = ordinals(fips)
+    values = load()[1][found].astype(np.float64)
+    values[found == -1] = np.nan
+    return values
+
+def validate(fips):
+    """List the distinct FIPS codes that have no known population"""
+    fips = pd.Series(fips)
+    return sorted(fips[ordinals(fips) == -1].dropna().astype(str).unique())
@@ -1,43 +1,39 @@
 """Tools for processing data"""
 
 # imports
-from . import pd
+from . import np, population
+
+# geographic areas without a FIPS identifier, by county name
+SPECIAL = {
+    'New York City': 'unique:nyc',  # New York City, New York
+    'Kansas City': 'unique:kc',  # Kansas City, Missouri
+    'Joplin': 'unique:jop',  # Joplin, Missouri
+}
 
 
 # functions
 def geoid2fips(df):
     """Convert geoid-tagged dataset to FIPS"""
-    df['geoid'].fillna(0, inplace=True)
-    col = df['geoid'].copy()
-    df['fips'] = col.apply(lambda x: x[4:])
+    df['fips'] = df['geoid'].str.slice(4)
     df.drop(columns=['geoid'], inplace=True)
     return df
 
 def populate(df):
     """Add corresponding population data to dataframe"""
-    populations = pd.read_csv('data/populations.csv')
-    df = df.merge(populations, on='fips', how='left')
+    df['population'] = population.lookup(df['fips'])
     return df
 
 def remaining(df):
     """Process remaining geographic areas (those without a FIPS identifier)"""
-
-    # New York City, New York
-    df.loc[df['county'] == 'New York City', 'fips'] = 'unique:nyc'
-
-    # Kansas City, Missouri
-    df.loc[df['county'] == 'Kansas City', 'fips'] = 'unique:kc'
-
-    # Joplin, Missouri
-    df.loc[df['county'] == 'Joplin', 'fips'] = 'unique:jop'
-
+    special = df['county'].map(SPECIAL)
+    df['fips'] = special.fillna(df['fips'])
     # 48999: 'Pending County Assignment'
-
     return df
 
 def normalize(df):
     """Normalize data by population"""
-    p_cases = df['cases'] / df['population']
-    p_deaths = df['deaths'] / df['population']
-    death_rate = df['deaths'] / df['cases']
-    return p_cases, p_deaths, death_rate
+    cases = df['cases'].to_numpy(np.float64)
+    deaths = df['deaths'].to_numpy(np.float64)
+    population = df['population'].to_numpy(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cases / population, deaths / population, deaths / cases
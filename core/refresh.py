@@ -0,0 +1,106 @@
+"""Background refresh of processed artifacts"""
+
+# imports
+import fcntl
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from . import get, ingest, scenarios, store
+
+# constants
+INTERVAL = 15 * 60  # seconds between staleness checks
+SOURCES = ['cumulative', 'rolling']
+
+# scheduler state
+fetcher = ingest.fetch  # replaceable, e.g. with a reader for local files
+thread = None
+lock = threading.Lock()
+preloading = False  # set in a gunicorn arbiter that preloads the app
+ready = False  # every source is stored; releases are never unpublished
+logger = logging.getLogger(__name__)
+
+
+# functions
+def target():
+    """Return the date that up-to-date artifacts should be tagged with"""
+    last_update = datetime.utcnow() - timedelta(hours=29)
+    return last_update.strftime('%Y-%m-%d')
+
+def missing():
+    """Check whether any source has no stored partitions"""
+    global ready
+    if not ready:  # listed until every source has been stored once
+        ready = all(store.exists(source) for source in SOURCES)
+    return not ready
+
+def stale():
+    """Check whether stored artifacts are outdated or missing"""
+    return target() != get.last_update() or missing()
+
+def run(fetch=None, block=False):
+    """Rebuild artifacts if stale, holding a lock shared by all workers"""
+
+    # an arbiter forks its workers, so it must never hold locks, threads or
+    # process pools; artifacts it needs are built in a separate process
+    if preloading:
+        subprocess.run([sys.executable, '-m', 'core.refresh'], check=True)
+        return True
+
+    os.makedirs('artifacts', exist_ok=True)
+    with open('artifacts/.refresh.lock', 'w') as f:
+
+        # only one refresher at a time; everyone else keeps serving
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if block else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+
+        try:
+            if stale():  # another worker may have just refreshed
+                ingest.run(target(), fetch=fetch or fetcher)
+                precompute()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    return True
+
+def precompute():
+    """Forecast every county for new artifacts, without failing a refresh"""
+    try:
+        scenarios.run()
+    except Exception:
+        logger.exception('forecast precomputation failed')
+
+def loop(interval, fetch):
+    """Periodically refresh stale artifacts until the process exits"""
+    while True:
+        try:
+            if stale():
+                run(fetch)
+        except Exception:
+            logger.exception('artifact refresh failed; serving last good data')
+        time.sleep(interval)
+
+def start(interval=INTERVAL, fetch=None):
+    """Start this process's background refresher, if it isn't running"""
+    global thread
+    if preloading:  # workers start their own after they are forked
+        return
+
+    with lock:
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(
+                target=loop, args=(interval, fetch),
+                name='refresh', daemon=True
+            )
+            thread.start()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run(block=True)
@@ -0,0 +1,180 @@
+"""Nightly forecasts of every county under every model and behavior"""
+
+# imports
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import cache, forecast, get, index, np
+
+# constants
+WORKERS = 2  # maximum concurrent scenario jobs
+ARRAYS = ['fips', 'length', 'population', 'historical']
+
+logger = logging.getLogger(__name__)
+
+
+# functions
+def directory(version):
+    """Return the directory holding forecasts for a data version"""
+    return f'artifacts/forecasts/{version}'
+
+def path(version, model, behavior, solver):
+    """Return the artifact path for one scenario's predictions"""
+    name = forecast.BEHAVIORS[behavior]
+    return f'{directory(version)}/{model}-{name}-{solver.lower()}.npy'
+
+def save(path, values):
+    """Write an array atomically, so readers never see partial files"""
+    with open(f'{path}.{os.getpid()}.tmp', 'wb') as f:
+        np.save(f, values)
+    os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+def prepare(version):
+    """Write every county's historical estimates, once per version"""
+    path = f'{directory(version)}/historical'
+    if os.path.isdir(path):
+        return path
+
+    # each county's stored rows, exactly as read when it is clicked
+    built = index.load('cumulative')
+    columns, slices = built['columns'], built['slices']
+    fips = np.array(sorted(slices))
+    spans = [slices[code] for code in fips]
+    stored = np.array([span.stop - span.start for span in spans])
+    delay = forecast.params['delay']
+    length = np.maximum(stored - delay, 0)  # estimates per county
+
+    # counties with as many stored days are estimated in one batch; series
+    # are right-aligned, so every county's latest estimate is last
+    historical = np.full((3, len(fips), length.max()), np.nan)
+    for days in np.unique(length[length > 0]):
+        rows = np.flatnonzero(length == days)
+        counts = forecast.historical(
+            np.stack([columns['cases'][spans[row]] for row in rows]),
+            np.stack([columns['deaths'][spans[row]] for row in rows]),
+            forecast.params['undercount'],
+            round(1 / forecast.params['gamma_inf']), delay
+        )
+        historical[:, rows, historical.shape[-1] - days:] = np.stack(counts)
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(f'{tmp}/fips.npy', fips)
+    np.save(f'{tmp}/length.npy', length)
+    np.save(
+        f'{tmp}/population.npy',
+        columns['population'][[span.start for span in spans]]
+    )
+    np.save(f'{tmp}/historical.npy', historical)
+    os.replace(tmp, path)
+    return path
+
+def load(version):
+    """Attach read-only views of a version's historical estimates"""
+    path = f'{directory(version)}/historical'
+    return cache.fetch(
+        'cumulative', version, None,
+        lambda: {
+            name: np.load(f'{path}/{name}.npy', mmap_mode='r')
+            for name in ARRAYS
+        },
+        kind='scenarios'
+    )
+
+def scenario(version, model, behavior, solver):
+    """Forecast every county under one scenario, in a worker process"""
+    start = time.perf_counter()
+    arrays = load(version)
+
+    # solved exactly as when a county is clicked, from the same estimates
+    predicted = forecast.solve(
+        model,
+        forecast.start(model, arrays['historical'], arrays['population']),
+        arrays['population'], forecast.rates(behavior),
+        forecast.HORIZON + forecast.params['delay'], solver
+    )
+    save(path(version, model, behavior, solver), predicted)
+
+    failed = ~np.isfinite(predicted).all(axis=(0, 2))
+    return {
+        'seconds': time.perf_counter() - start,
+        'counties': len(arrays['fips']),
+        'failed': arrays['fips'][failed].tolist(),
+    }
+
+def run(version=None, workers=WORKERS):
+    """Forecast all scenarios that aren't stored yet, logging progress"""
+    version = version or get.last_update()
+    os.makedirs(directory(version), exist_ok=True)
+    prepare(version)
+
+    # scenarios finished by an earlier, interrupted run are kept
+    todo = [
+        (model, behavior, solver)
+        for model in forecast.MODELS for behavior in forecast.BEHAVIORS
+        for solver in forecast.SOLVERS
+        if not os.path.isfile(path(version, model, behavior, solver))
+    ]
+    logger.info('forecasting %d scenarios for %s', len(todo), version)
+
+    # started from a server worker's refresh thread, so never forked
+    forkserver = multiprocessing.get_context('forkserver')
+    with ProcessPoolExecutor(workers, mp_context=forkserver) as processes:
+        futures = {
+            processes.submit(scenario, version, *job): job for job in todo
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            name = '/'.join(futures[future])
+            try:
+                timing = future.result()
+            except Exception:
+                logger.exception('forecast %s failed', name)
+                continue
+
+            if timing['failed']:
+                logger.warning(
+                    '%s: no forecast for %s', name, timing['failed']
+                )
+            logger.info(
+                'forecast %s (%d/%d): %.2fs for %d counties',
+                name, done, len(todo), timing['seconds'], timing['counties']
+            )
+
+    # remove forecasts from older versions
+    for old in os.listdir('artifacts/forecasts'):
+        if old != version:
+            shutil.rmtree(f'artifacts/forecasts/{old}', ignore_errors=True)
+
+def lookup(fips, model, behavior, solver):
+    """Read a county's stored forecast, or None if it isn't computed yet"""
+    version = get.last_update()
+    if not os.path.isfile(path(version, model, behavior, solver)):
+        return None
+
+    arrays = load(version)
+    row = np.searchsorted(arrays['fips'], fips)
+    if row == len(arrays['fips']) or arrays['fips'][row] != fips:
+        return None
+
+    length = arrays['length'][row]
+    if length == 0:  # too short a history to estimate
+        return None
+
+    return {
+        'dates': index.lookup(fips, columns=['date'])['date'],
+        'population': arrays['population'][row],
+        'historical': list(arrays['historical'][:, row, -length:]),
+        'predicted': np.load(
+            path(version, model, behavior, solver), mmap_mode='r'
+        )[:, row],
+    }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run()
@@ -0,0 +1,101 @@
+"""Memory-mapped datasets shared between server workers"""
+
+# imports
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+from . import display, encode, get, np, pd, store
+
+# shared-memory mode, enabled with NOTEBOOK_SHARED=1
+ENABLED = os.environ.get('NOTEBOOK_SHARED', '') not in ['', '0']
+
+# parsed county GeoJSON, loaded once per process
+geojson = None
+
+
+# functions
+def directory(source, version):
+    """Return the directory holding shared arrays for a source and version"""
+    return f'artifacts/shared/{version}/{source}'
+
+@contextmanager
+def locked():
+    """Hold an exclusive lock shared by every worker on the machine"""
+    os.makedirs('artifacts/shared', exist_ok=True)
+    with open('artifacts/shared/.lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def export(source):
+    """Write a source's full history as memory-mappable arrays, once"""
+    version = get.last_update()
+    path = directory(source, version)
+    if os.path.isdir(path):
+        return path
+
+    with locked():
+        if os.path.isdir(path):  # another worker finished first
+            return path
+
+        # sort by county, then by date, to match the FIPS index
+        df = store.decode(store.read(source))
+        df.sort_values(by=['fips', 'date'], inplace=True, kind='stable')
+        df = display.labels(df)
+
+        # write arrays; strings become fixed-width so they can be mapped
+        tmp = f'{path}.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for col in df.columns:
+            values = df[col].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            np.save(f'{tmp}/{col}.npy', values)
+        with open(f'{tmp}/meta.json', 'w') as f:
+            json.dump({
+                'columns': list(df.columns),
+                'latest': df['date'].max(),
+            }, f)
+        os.replace(tmp, path)
+
+        # remove arrays from older versions
+        for old in os.listdir('artifacts/shared'):
+            if old not in [version, '.lock']:
+                shutil.rmtree(f'artifacts/shared/{old}', ignore_errors=True)
+
+    return path
+
+def meta(source):
+    """Return column names and the latest date of exported arrays"""
+    with open(f'{export(source)}/meta.json', 'r') as f:
+        return json.load(f)
+
+def history(source):
+    """Attach read-only views of a source's full, FIPS-sorted history"""
+    path = export(source)
+    return {
+        col: np.load(f'{path}/{col}.npy', mmap_mode='r')
+        for col in meta(source)['columns']
+    }
+
+def latest(source):
+    """Return the latest reported day of a source from shared arrays"""
+    columns = history(source)
+    mask = columns['date'] == meta(source)['latest']
+    return pd.DataFrame({
+        col: values[mask] for col, values in columns.items()
+        if col != 'date'
+    })
+
+def counties():
+    """Return county GeoJSON, parsed once and shared copy-on-write"""
+    global geojson
+    if geojson is None:
+        geojson = encode.load('data/counties.geojson')
+    return geojson
@@ -0,0 +1,181 @@
+"""Columnar, date-partitioned storage for processed artifacts"""
+
+# imports
+import json
+import os
+import shutil
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from . import np, pd
+
+# constants
+CATEGORICAL = ['fips', 'state', 'county']
+
+
+# functions
+def directory(source):
+    """Return the partition directory for a given source"""
+    return f'artifacts/{source}'
+
+def partition(source, date):
+    """Return the path of a single date partition"""
+    return f'{directory(source)}/{date}.parquet'
+
+def dates(source):
+    """List all stored dates for a given source, in ascending order"""
+    if not os.path.isdir(directory(source)):
+        return []
+    return sorted(
+        name[:-len('.parquet')]
+        for name in os.listdir(directory(source))
+        if name.endswith('.parquet') and not name.startswith('.')
+    )
+
+def exists(source):
+    """Check whether any partitions have been written for a source"""
+    return len(dates(source)) > 0
+
+def latest(source):
+    """Return the most recent stored date for a given source"""
+    stored = dates(source)
+    return stored[-1] if stored else None
+
+def typed(df):
+    """Cast processed data to the column types used in storage"""
+    df = df.copy()
+    df['fips'] = df['fips'].astype(str)
+    for col in CATEGORICAL:
+        df[col] = df[col].astype('category')
+    for col in df.columns:  # keep schemas identical across partitions
+        if col not in CATEGORICAL and col != 'date':
+            df[col] = df[col].astype(np.float64)
+    return df
+
+def release(source):
+    """Create a fresh, unpublished release directory for a source"""
+    path = f'artifacts/releases/{source}-{time.time_ns()}'
+    os.makedirs(path)
+    return path
+
+def stage(df, source):
+    """Write processed data into a fresh, unpublished release directory"""
+    path = release(source)
+    df = typed(df)
+    for date, part in df.groupby('date', sort=False):
+        part.to_parquet(f'{path}/{date}.parquet', index=False)
+    return path
+
+def mark(path, watermark):
+    """Record what has been ingested alongside a release's partitions"""
+    with open(f'{path}/_watermark.json', 'w') as f:
+        json.dump(watermark, f)
+
+def merge(df, source, watermark):
+    """Replace only the dates present in `df`, keeping all other partitions"""
+    path = stage(df, source)
+
+    # hard-link unchanged partitions from the current release
+    for date in dates(source):
+        if not os.path.exists(f'{path}/{date}.parquet'):
+            os.link(partition(source, date), f'{path}/{date}.parquet')
+
+    mark(path, watermark)
+    publish(source, path)
+
+def schema(df):
+    """Return an Arrow schema for typed data that is stable across chunks"""
+    fixed = pa.Schema.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(fixed):
+        if pa.types.is_dictionary(field.type):  # index width varies by chunk
+            fixed = fixed.set(
+                i, field.with_type(pa.dictionary(pa.int32(), pa.string()))
+            )
+    return fixed
+
+def stream(frames, source):
+    """Write processed chunks to date partitions of an unpublished release"""
+    path = release(source)
+    writers = {}
+    closed = set()
+    fixed = None
+
+    try:
+        for df in frames:
+            df = typed(df)
+            if fixed is None:
+                fixed = schema(df)
+
+            # append each day's rows to its partition
+            for date, part in df.groupby('date', sort=False):
+                if date in closed:
+                    raise ValueError(f'{source} feed is not sorted by date')
+                if date not in writers:
+                    writers[date] = pq.ParquetWriter(
+                        f'{path}/{date}.parquet', fixed
+                    )
+                writers[date].write_table(pa.Table.from_pandas(
+                    part, schema=fixed, preserve_index=False
+                ))
+
+            # feeds are sorted by date, so earlier partitions are complete
+            for date in [d for d in writers if d < df['date'].min()]:
+                writers.pop(date).close()
+                closed.add(date)
+
+        for writer in writers.values():
+            writer.close()
+
+    # publish never prunes releases it hasn't seen, so drop partial ones here
+    except BaseException:
+        for writer in writers.values():
+            writer.close()
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+
+    return path
+
+def watermark(source):
+    """Return the ingest watermark of the current release, if any"""
+    path = f'{directory(source)}/_watermark.json'
+    if not os.path.isfile(path):
+        return {'latest': None, 'digests': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def publish(source, release):
+    """Atomically point a source at a new release directory"""
+    link = directory(source)
+    previous = os.path.realpath(link)
+
+    # replace partitions written before releases were introduced
+    if os.path.isdir(link) and not os.path.islink(link):
+        shutil.rmtree(link)
+
+    # swap the symlink in a single rename
+    tmp = f'artifacts/.{source}.link'
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(os.path.relpath(release, 'artifacts'), tmp)
+    os.replace(tmp, link)
+
+    # keep the previous release for in-flight readers, drop older ones
+    keep = [os.path.realpath(release), previous]
+    for name in os.listdir('artifacts/releases'):
+        path = os.path.realpath(f'artifacts/releases/{name}')
+        if name.startswith(f'{source}-') and path not in keep:
+            shutil.rmtree(path)
+
+def read(source, date=None):
+    """Read stored data, optionally restricted to a single date"""
+    path = directory(source) if date is None else partition(source, date)
+    return pd.read_parquet(path)
+
+def decode(df):
+    """Convert categorical columns back to plain strings"""
+    for col in CATEGORICAL:
+        if col in df.columns:
+            df[col] = df[col].astype(str)
+    return df
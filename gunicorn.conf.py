@@ -0,0 +1,31 @@
+"""Gunicorn configuration for serving the notebook"""
+
+# imports
+import gc
+
+import core
+
+# load the app once in the arbiter when sharing memory between workers; the
+# arbiter then only reads artifacts, and each worker refreshes them
+preload_app = core.shared.ENABLED
+core.refresh.preloading = preload_app
+
+
+# hooks
+def on_starting(server):
+    """Precompute shared artifacts once, before any worker is forked"""
+    for level in core.geometry.LEVELS:
+        core.geometry.counties(level)
+    if core.shared.ENABLED:
+        for source in ['cumulative', 'rolling']:
+            core.shared.export(source)
+
+def pre_fork(server, worker):
+    """Keep preloaded objects out of garbage collection in workers"""
+    if core.shared.ENABLED:
+        gc.freeze()  # avoids copy-on-write faults on shared pages
+
+def post_fork(server, worker):
+    """Refresh artifacts in the background from each worker"""
+    core.refresh.preloading = False
+    core.refresh.start()